@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the core matching and parsing functions on synthetic datasets.
+
+The datasets mimic the real inputs (catalog entries, parsed settlements, the KOATUU
+transition table, decerkva) and are generated at multiples of their current size:
+415 catalog entries, 1459 settlements and ~39k KOATUU rows at scale 1.
+
+    python3 scripts/benchmarks.py                                   # scales 1, 10 and 100
+    python3 scripts/benchmarks.py --scales 1 10 --bench koatuu.update_settlements
+    python3 scripts/benchmarks.py --output base.json                # save a baseline
+    python3 scripts/benchmarks.py --baseline base.json              # compare against it
+
+The decerkva page parsing benchmarks cycle through the hand-built fixture pages in
+`scripts/__mocks__/decerkva`, which imitate the site's markup.
+
+Results are saved as JSON (`.pipeline/benchmarks.json` by default). A benchmark whose
+single run takes longer than --time-limit is not run at the larger scales.
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from copy import deepcopy
+from datetime import datetime, timezone
+from functools import cached_property
+
+import data_io
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+RESULTS_FILE = os.path.join(ROOT_DIR, ".pipeline", "benchmarks.json")
+# Hand-built fixture pages in the decerkva markup (main, region, district and settlement page)
+DECERKVA_FIXTURES = os.path.join(BASE_DIR, "__mocks__", "decerkva")
+
+# Size of the real datasets, i.e. scale 1
+CATALOG_ENTRIES = 415
+SETTLEMENTS = 1459
+KOATUU_ROWS = 39417
+DECERKVA_SETTLEMENTS = 2276
+SEGMENTS_PER_ENTRY = 40
+# decerkva pages parsed per run at scale 1, cycling through the fixtures
+DECERKVA_PAGES = 100
+OBLASTS = 27
+CATALOG_PAGES = 200
+
+STEMS = ["Бер", "Вол", "Гор", "Дуб", "Жит", "Зал", "Кам", "Кос", "Луц", "Мал", "Ост", "Пер",
+         "Рів", "Сар", "Тер", "Хол", "Чер", "Шум", "Ясн", "Біл", "Вер", "Глин", "Дер", "Кор"]
+SYLLABLES = ["а", "ба", "ве", "во", "ди", "до", "жи", "за", "ко", "ли", "ло", "ма", "ни", "но",
+             "ос", "пе", "по", "ри", "ро", "се", "сто", "ту", "хо", "ча", "ши", "ян"]
+ENDINGS = ["ів", "ка", "не", "ці", "ичі", "инь", "ове", "ище", "ин", "івка"]
+CHURCHES = ["Церква Покрови Пресвятої Богородиці", "Миколаївська церква", "Церква Святої Трійці",
+            "Параскевська церква", "Успенська церква", "Римо-католицький костел"]
+RELIGIONS = ["orthodox", "orthodox", "orthodox", "roman_catholic", "greek_catholic", "judaism"]
+SETTLEMENT_TYPES = ["С"] * 14 + [""] * 4 + ["Щ", "Т", "М"]
+
+
+class SyntheticData:
+    """Synthetic datasets of one scale, generated on first use with a fixed seed."""
+
+    def __init__(self, scale, seed=0):
+        self.scale = scale
+        self.rng = random.Random(seed * 1000 + scale)
+        self.tmp_dir = tempfile.TemporaryDirectory(prefix="parafii-bench-")
+
+    def close(self):
+        self.tmp_dir.cleanup()
+
+    def settlement_name(self):
+        rng = self.rng
+        return (rng.choice(SYLLABLES) + rng.choice(SYLLABLES) + rng.choice(ENDINGS)).capitalize()
+
+    def write_json(self, name, data):
+        path = os.path.join(self.tmp_dir.name, name)
+        data_io.write_json(path, data)
+        return path
+
+    @cached_property
+    def geography(self):
+        """Oblasts with their rayons and settlement names: [(oblast, code, [(rayon, code, [names])])]."""
+        rayons_per_oblast = min(20 * self.scale, 799)
+        per_rayon = max(KOATUU_ROWS * self.scale // (OBLASTS * rayons_per_oblast), 1)
+        geography = []
+        for o in range(1, OBLASTS + 1):
+            oblast = f"{STEMS[o % len(STEMS)]}{self.rng.choice(SYLLABLES)}ська"
+            rayons = []
+            for r in range(rayons_per_oblast):
+                rayon = f"{self.settlement_name()}ський"
+                names = [self.settlement_name() for _ in range(per_rayon)]
+                rayons.append((rayon, f"{o:02d}{201 + r:03d}00000", names))
+            geography.append((oblast, f"{o:02d}00000000", rayons))
+        return geography
+
+    @cached_property
+    def koatuu(self):
+        """Rows of the KOATUU transition table, as returned by find_koatuu_code.load_csv."""
+        rows = []
+        for oblast, oblast_code, rayons in self.geography:
+            rows.append(self.koatuu_row(oblast_code, "", f"{oblast.upper()} ОБЛАСТЬ/М.{oblast.upper()}"))
+            for rayon, rayon_code, names in rayons:
+                rows.append(self.koatuu_row(rayon_code, "", f"{rayon.upper()} РАЙОН"))
+                for i, name in enumerate(names):
+                    code = f"{rayon_code[:5]}{i + 1:05d}"
+                    rows.append(self.koatuu_row(code, self.rng.choice(SETTLEMENT_TYPES), name.upper()))
+        return rows
+
+    def koatuu_row(self, code, type_letter, name):
+        return {
+            "TE": code,
+            "NP": type_letter,
+            "NU": name,
+            "Код об’єкта Кодифікатора": f"UA{code}{self.rng.randrange(10 ** 9):09d}",
+            "Категорія об’єкта Кодифікатора": type_letter,
+            "Назва об’єкта Кодифікатора": name.capitalize(),
+        }
+
+    @cached_property
+    def povits(self):
+        return [f"{stem}ський" for stem in STEMS[:12]]
+
+    @cached_property
+    def volosts(self):
+        return [f"{self.settlement_name()}ська" for _ in range(200 * self.scale)]
+
+    @cached_property
+    def settlements(self):
+        """Settlements as produced by parse_settlements.py; about 1 in 10 has no KOATUU record."""
+        rng = self.rng
+        pages = CATALOG_PAGES * self.scale
+        settlements = []
+        for _ in range(SETTLEMENTS * self.scale):
+            oblast, _, rayons = rng.choice(self.geography)
+            rayon, _, names = rng.choice(rayons)
+            name = rng.choice(names) if rng.random() < 0.9 else self.settlement_name()
+            povit, volost = rng.choice(self.povits), rng.choice(self.volosts)
+            historic_title = f"Волинська губ., {povit} пов., {volost} вол."
+            old_title = f"{name}, с., {oblast} обл., {rayon} р-н"
+            settlements.append({
+                "name": name,
+                "title": f"{name}, {historic_title} ({old_title}) {rng.randint(4, pages)}",
+                "historic_district": {"governorate": "Волинська", "povit": povit, "volost": volost,
+                                      "title": historic_title},
+                "old_district": {"name": name, "oblast": oblast, "rayon": rayon, "title": old_title},
+                "pages": sorted(rng.sample(range(4, pages + 4), rng.choice([1, 1, 1, 2]))),
+            })
+        return settlements
+
+    @cached_property
+    def settlements_locations(self):
+        """Settlements with the fields added by the KOATUU, details and geocoder stages."""
+        rng = self.rng
+        locations = deepcopy(self.settlements)
+        for i, settlement in enumerate(locations):
+            old_district = settlement["old_district"]
+            old_district["koatuu"] = f"{i:010d}"
+            old_district["type"] = "село"
+            settlement["new_district"] = {
+                "katotth": f"UA{i:017d}", "name": settlement["name"], "type": "село",
+                "region": f"{old_district['oblast']} область", "rayon": f"{old_district['rayon']} район",
+                "hromada": f"{rng.choice(STEMS)}ська",
+            }
+            settlement["osm_id"] = str(rng.randrange(10 ** 9))
+            settlement["location"] = [round(rng.uniform(24, 28), 6), round(rng.uniform(50, 52), 6)]
+        return locations
+
+    @cached_property
+    def catalog(self):
+        """Catalog entries referring to the settlements, as produced by metric_catalog_parser.py."""
+        rng = self.rng
+        catalog = []
+        for i in range(CATALOG_ENTRIES * self.scale):
+            settlement = rng.choice(self.settlements)
+            historic = settlement["historic_district"]
+            church = rng.choice(CHURCHES)
+            catalog.append({
+                "religion": rng.choice(RELIGIONS),
+                "page": settlement["pages"][0] + rng.choice([-1, 0, 0, 0, 1]),
+                "territory": "Волинська губернія",
+                "church": church,
+                "parafiya": f"{church}, с. {settlement['name']} {historic['povit']} повіту",
+                "settlements": ", ".join(self.settlement_name() for _ in range(rng.randint(1, 6))),
+                "church_settlement": settlement["name"],
+                "povit": historic["povit"],
+                "volost": historic["volost"],
+                "id": f"{i:08x}",
+            })
+        return catalog
+
+    @cached_property
+    def parafii(self):
+        """Parishes with their settlement districts, as in parafii_locations.json."""
+        rng = self.rng
+        parafii = []
+        for entry in self.catalog:
+            settlement = rng.choice(self.settlements_locations)
+            parafii.append({
+                "id": entry["id"],
+                "title": entry["parafiya"],
+                "church": entry["church"],
+                "church_settlement": entry["church_settlement"],
+                "religion": entry["religion"],
+                "settlements": entry["settlements"],
+                "location": settlement["location"],
+                "old_district": settlement["old_district"],
+                "new_district": settlement["new_district"],
+            })
+        return parafii
+
+    @cached_property
+    def decerkva(self):
+        """decerkva.json regions, covering the rayons of the first oblasts."""
+        rng = self.rng
+        per_oblast = DECERKVA_SETTLEMENTS * self.scale // 8
+        regions = []
+        for oblast, _, rayons in self.geography[:8]:
+            districts = {}
+            for _ in range(per_oblast):
+                rayon, _, names = rng.choice(rayons)
+                district = districts.setdefault(rayon, {"district": f"{rayon} район", "settlements": []})
+                district["settlements"].append({
+                    "name": rng.choice(names),
+                    "church_name": f"Церква {rng.choice(CHURCHES).split()[-1]}",
+                    "url": "http://decerkva.org.ua/",
+                    "location": [round(rng.uniform(50, 52), 6), round(rng.uniform(24, 28), 6)],
+                })
+            regions.append({"region": f"{oblast} область", "districts": list(districts.values())})
+        return regions
+
+    @cached_property
+    def segments(self):
+        """Book reference segments of the catalog, as parsed by metric_catalog_parser.parse_segment."""
+        rng = self.rng
+        segments = []
+        for _ in range(CATALOG_ENTRIES * SEGMENTS_PER_ENTRY * self.scale):
+            start = rng.randint(1800, 1938)
+            years = f"{start}–{start + rng.randint(1, 8)}" if rng.random() < 0.8 else str(start)
+            fond = rng.choice(["485", "Р–740", "639", "Р-720"])
+            segments.append(f"{years}: ф. {fond}, оп. {rng.randint(1, 9)}, спр. {rng.randint(1, 500)}")
+        return segments
+
+
+# --------------------------------------------------------------------------- #
+# Benchmarks                                                                  #
+# --------------------------------------------------------------------------- #
+# Each benchmark takes the synthetic data of a scale and returns (setup, run, items):
+# setup() prepares the arguments of one run (not timed), run(args) is timed and
+# items is the number of records processed.
+
+def bench_koatuu_update_settlements(data):
+    import find_koatuu_code
+    settlements, rows = data.settlements, data.koatuu
+    return (lambda: (deepcopy(settlements), rows),
+            lambda args: find_koatuu_code.update_settlements(*args),
+            len(settlements))
+
+
+def bench_parafii_match_entry(data):
+    import find_parafii_locations
+    catalog, locations = data.catalog, data.settlements_locations
+
+    def run(_):
+        index = find_parafii_locations.LocationsIndex(locations)
+        for entry in catalog:
+            find_parafii_locations.match_entry(entry, index)
+
+    return lambda: None, run, len(catalog)
+
+
+def bench_churches_find_matches(data):
+    import match_churches
+    parafii_file = data.write_json("parafii_locations.json", data.parafii)
+    decerkva_file = data.write_json("decerkva.json", data.decerkva)
+    logger = logging.getLogger("match_churches")
+    return (lambda: None,
+            lambda _: match_churches.find_matches(parafii_file, decerkva_file, logger),
+            len(data.parafii))
+
+
+def bench_tree_view(data):
+    import export_parafii_to_tree_view
+    parafii_file = data.write_json("parafii_locations.json", data.parafii)
+    return (lambda: None,
+            lambda _: export_parafii_to_tree_view.generate_tree_view(parafii_file),
+            len(data.parafii))
+
+
+def bench_parse_segment(data):
+    import metric_catalog_parser
+    segments = data.segments
+    logger = logging.getLogger("metric_catalog_parser")
+
+    def run(_):
+        for seg in segments:
+            metric_catalog_parser.parse_segment(seg, 1, "births", logger)
+
+    return lambda: None, run, len(segments)
+
+
+def decerkva_parse_pages(backend):
+    def bench(data):
+        import decerkva_parser
+        if backend == "lxml" and decerkva_parser.lxml_html is None:
+            raise ImportError("lxml is not installed")
+        fixtures = []
+        for name in sorted(os.listdir(DECERKVA_FIXTURES)):
+            with open(os.path.join(DECERKVA_FIXTURES, name), "rb") as f:
+                fixtures.append(f.read().decode("windows-1251"))
+        pages = [fixtures[i % len(fixtures)] for i in range(DECERKVA_PAGES * data.scale)]
+        logger = logging.getLogger("decerkva_parser")
+
+        def run(_):
+            for html in pages:
+                page = decerkva_parser.Page(html, backend)
+                decerkva_parser.region_links(page)
+                decerkva_parser.district_links(page, decerkva_parser.MAIN_URL)
+                decerkva_parser.settlement_links(page, decerkva_parser.MAIN_URL)
+                decerkva_parser.parse_settlement(page, decerkva_parser.MAIN_URL, "", logger)
+
+        return lambda: None, run, len(pages)
+
+    return bench
+
+
+def bench_io_catalog_roundtrip(data):
+    catalog = data.catalog
+    path = os.path.join(data.tmp_dir.name, "catalog_roundtrip.json")
+
+    def run(_):
+        data_io.write_json(path, catalog)
+        data_io.read_json(path)
+
+    return lambda: None, run, len(catalog)
+
+
+BENCHMARKS = {
+    "koatuu.update_settlements": bench_koatuu_update_settlements,
+    "parafii.match_entry": bench_parafii_match_entry,
+    "churches.find_matches": bench_churches_find_matches,
+    "tree_view.generate_tree_view": bench_tree_view,
+    "catalog.parse_segment": bench_parse_segment,
+    "io.catalog_roundtrip": bench_io_catalog_roundtrip,
+    "decerkva.parse_pages": decerkva_parse_pages("lxml"),
+    "decerkva.parse_pages_html_parser": decerkva_parse_pages("html.parser"),
+}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence prints and log messages of the benchmarked functions."""
+    logging.disable(logging.CRITICAL)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def time_benchmark(benchmark, data, repeat, time_limit):
+    setup, run, items = benchmark(data)
+    timings = []
+    for _ in range(repeat):
+        args = setup()
+        with quiet():
+            started = time.perf_counter()
+            run(args)
+            timings.append(time.perf_counter() - started)
+        if timings[-1] > time_limit:
+            break
+    return {
+        "items": items,
+        "runs": len(timings),
+        "min_seconds": round(min(timings), 6),
+        "median_seconds": round(statistics.median(timings), 6),
+    }
+
+
+def run_benchmarks(names, scales, repeat, time_limit):
+    results = {name: {} for name in names}
+    too_slow = {}
+    for scale in scales:
+        data = SyntheticData(scale)
+        try:
+            for name in names:
+                if name in too_slow:
+                    results[name][str(scale)] = {"skipped": too_slow[name]}
+                    continue
+                print(f"→ {name} at scale {scale} …", flush=True)
+                try:
+                    result = time_benchmark(BENCHMARKS[name], data, repeat, time_limit)
+                except ImportError as e:
+                    print(f"  skipped: {e}")
+                    results[name][str(scale)] = {"skipped": str(e)}
+                    too_slow[name] = str(e)
+                    continue
+                results[name][str(scale)] = result
+                print(f"  {result['median_seconds']:.4f}s for {result['items']} items")
+                if result["min_seconds"] > time_limit:
+                    too_slow[name] = f"took {result['min_seconds']:.1f}s at scale {scale}"
+        finally:
+            data.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against the baseline; returns the number of regressions."""
+    regressions = 0
+    print(f"\n{'benchmark':32} {'scale':>5} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, scales in results.items():
+        for scale, result in scales.items():
+            base = baseline.get("results", {}).get(name, {}).get(scale, {})
+            if "median_seconds" not in result or "median_seconds" not in base:
+                continue
+            ratio = result["median_seconds"] / base["median_seconds"] if base["median_seconds"] else 1.0
+            regressed = ratio > 1 + tolerance
+            regressions += regressed
+            print(f"{name:32} {scale:>5} {base['median_seconds']:>10.4f} {result['median_seconds']:>10.4f} "
+                  f"{ratio:>7.2f}x{' ✖' if regressed else ''}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the matching stages on synthetic datasets.")
+    parser.add_argument("--bench", action="append", choices=sorted(BENCHMARKS), metavar="NAME",
+                        help=f"benchmark to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10, 100],
+                        help="dataset sizes as multiples of the current data (default: 1 10 100)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark and scale (default: 3)")
+    parser.add_argument("--time-limit", type=float, default=60.0, metavar="SECONDS",
+                        help="skip the larger scales of a benchmark whose run takes longer (default: 60)")
+    parser.add_argument("--output", default=RESULTS_FILE, metavar="FILE",
+                        help=f"where to save the results (default: {os.path.relpath(RESULTS_FILE, ROOT_DIR)})")
+    parser.add_argument("--baseline", metavar="FILE", help="compare the results with a saved run")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="slowdown against the baseline reported as a regression (default: 0.25)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, BASE_DIR)
+
+    names = args.bench or list(BENCHMARKS)
+    results = run_benchmarks(names, sorted(args.scales), args.repeat, args.time_limit)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    output = os.path.abspath(args.output)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    data_io.write_json(output, report, indent=2)
+    print(f"Benchmark results saved to {args.output}")
+
+    if args.baseline:
+        baseline = data_io.read_json(args.baseline)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
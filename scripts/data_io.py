@@ -0,0 +1,83 @@
+"""
+JSON input and output shared by the scripts.
+
+Uses orjson when it is installed and the standard json module otherwise. Internal
+intermediates are written compact; pass indent for the files people read or review.
+Files are written to a temporary file first and moved into place, so an interrupted
+run never leaves a truncated file behind, and lists are written item by item.
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Set PRETTY_JSON=1 to indent every file, e.g. to compare intermediates by eye
+PRETTY = os.environ.get("PRETTY_JSON", "") not in ("", "0")
+DEFAULT_INDENT = 2
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(data, indent=None):
+    """Serialize to a str; compact without indent, like json.dumps(..., indent=indent) otherwise."""
+    if orjson is not None and indent in (None, 2):
+        try:
+            option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+            return orjson.dumps(data, option=option).decode("utf-8")
+        except TypeError:
+            pass  # e.g. integers wider than 64 bits, let json handle it
+    separators = (",", ":") if indent is None else (",", ": ")
+    return json.dumps(data, ensure_ascii=False, indent=indent, separators=separators)
+
+
+def read_json(path):
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def write_json(path, data, indent=None):
+    """
+    Write data to path atomically. Without indent the output is compact; lists are
+    streamed item by item. Returns the number of bytes written.
+    """
+    if isinstance(data, list):
+        return write_json_array(path, data, indent)
+    if indent is None and PRETTY:
+        indent = DEFAULT_INDENT
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write(dumps(data, indent))
+    os.replace(tmp_file, path)
+    return os.path.getsize(path)
+
+
+def write_json_array(path, items, indent=None):
+    """
+    Write the items (any iterable, e.g. a generator) as a JSON array, one item at a
+    time, so the whole document is never held in memory as a string. The output is
+    the same as write_json would produce for the list. Returns the number of bytes written.
+    """
+    if indent is None and PRETTY:
+        indent = DEFAULT_INDENT
+    tmp_file = path + ".tmp"
+    prefix = "\n" + " " * indent if indent else ""
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        f.write("[")
+        empty = True
+        for item in items:
+            if not empty:
+                f.write(",")
+            text = dumps(item, indent)
+            f.write(prefix + text.replace("\n", prefix) if indent else text)
+            empty = False
+        f.write("\n]" if indent and not empty else "]")
+    os.replace(tmp_file, path)
+    return os.path.getsize(path)
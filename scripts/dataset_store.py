@@ -0,0 +1,205 @@
+"""
+SQLite store of the pipeline datasets.
+
+The intermediates (catalog, parsed settlements, settlements with locations, parafii
+locations) are kept as one row per record, stored whole as JSON in their original
+order, and the JSON files the site and the scripts use are exported from the store
+unchanged. The store is persistence only: the stages still work on the whole
+datasets, with their own in-memory indexes for lookups.
+
+Saving a dataset only touches the rows that changed, so a partial re-run updates a few
+rows instead of rewriting everything.
+
+Usage (from the repository root):
+    python3 scripts/dataset_store.py import             # load the JSON files
+    python3 scripts/dataset_store.py export             # write the JSON files from the store
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+
+import data_io
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+STORE_FILE = os.path.join(ROOT_DIR, ".pipeline", "datasets.sqlite")
+
+CATALOG_JSON = "data/catalog.json"
+PARSED_SETTLEMENTS_JSON = "data/parsed_settlements.json"
+SETTLEMENTS_LOCATIONS_JSON = "data/settlements_locations.json"
+PARAFII_LOCATIONS_JSON = "data/parafii_locations.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog (
+    seq INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS settlements (
+    dataset TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (dataset, seq)
+);
+
+CREATE TABLE IF NOT EXISTS parishes (
+    seq INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL
+);
+
+-- Query tables of older stores
+DROP TABLE IF EXISTS koatuu;
+DROP TABLE IF EXISTS settlement_pages;
+"""
+
+
+def dump_record(record):
+    return data_io.dumps(record)
+
+
+# Dataset files kept in the store: path -> table
+DATASETS = {
+    CATALOG_JSON: "catalog",
+    PARSED_SETTLEMENTS_JSON: "settlements",
+    SETTLEMENTS_LOCATIONS_JSON: "settlements",
+    PARAFII_LOCATIONS_JSON: "parishes",
+}
+
+
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DatasetStore:
+    def __init__(self, path=STORE_FILE):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # master.py runs in-process stages in a worker thread, one at a time
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def table(path):
+        if path not in DATASETS:
+            raise KeyError(f"{path} is not kept in the dataset store")
+        return DATASETS[path]
+
+    def _where(self, path):
+        """Condition selecting the rows of the dataset (settlements share one table)."""
+        table = self.table(path)
+        if table == "settlements":
+            return table, "dataset = ?", (path,)
+        return table, "1 = 1", ()
+
+    def has(self, path):
+        table, where, params = self._where(path)
+        return self.connection.execute(f"SELECT 1 FROM {table} WHERE {where} LIMIT 1", params).fetchone() is not None
+
+    def iter_records(self, path):
+        """Yield the records of the dataset in their original order."""
+        table, where, params = self._where(path)
+        rows = self.connection.execute(f"SELECT data FROM {table} WHERE {where} ORDER BY seq", params)
+        for data, in rows:
+            yield data_io.loads(data)
+
+    def load(self, path):
+        return list(self.iter_records(path))
+
+    def save(self, path, records):
+        """
+        Store the records of the dataset, touching only the rows that changed.
+        Returns the number of inserted, updated and deleted rows.
+        """
+        table, where, params = self._where(path)
+        existing = dict(self.connection.execute(f"SELECT seq, data FROM {table} WHERE {where}", params))
+        inserted = updated = 0
+
+        with self.connection:
+            for seq, record in enumerate(records):
+                data = dump_record(record)
+                previous = existing.pop(seq, None)
+                if previous == data:
+                    continue
+                row = {"dataset": path} if table == "settlements" else {}
+                row.update(seq=seq, data=data)
+                names = ", ".join(row)
+                placeholders = ", ".join("?" for _ in row)
+                self.connection.execute(f"INSERT OR REPLACE INTO {table} ({names}) VALUES ({placeholders})", tuple(row.values()))
+                if previous is None:
+                    inserted += 1
+                else:
+                    updated += 1
+
+            stale = [(seq,) for seq in existing]
+            self.connection.executemany(f"DELETE FROM {table} WHERE {where} AND seq = ?", [params + seq for seq in stale])
+
+        return inserted, updated, len(stale)
+
+    def export(self, path, target, indent=None):
+        """Stream the dataset as JSON to target; returns the fingerprint of the written file."""
+        data_io.write_json_array(target, self.iter_records(path), indent)
+        fingerprint = file_fingerprint(target)
+        self.set_source(path, fingerprint)
+        return fingerprint
+
+    def source(self, path):
+        """Fingerprint of the file the dataset was last imported from or exported to."""
+        row = self.connection.execute("SELECT fingerprint FROM sources WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def set_source(self, path, fingerprint):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO sources (path, fingerprint) VALUES (?, ?)", (path, fingerprint))
+
+    def import_json(self, path, source):
+        counts = self.save(path, data_io.read_json(source))
+        self.set_source(path, file_fingerprint(source))
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the pipeline datasets in an SQLite store.")
+    parser.add_argument("--db", default=STORE_FILE, help=f"store file (default: {os.path.relpath(STORE_FILE, ROOT_DIR)})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("import", help="load the JSON datasets into the store")
+    commands.add_parser("export", help="write the JSON datasets from the store")
+    args = parser.parse_args()
+
+    with DatasetStore(args.db) as store:
+        if args.command == "import":
+            for path in DATASETS:
+                source = os.path.join(ROOT_DIR, path)
+                if not os.path.exists(source):
+                    print(f"Skipping {path} (missing)")
+                    continue
+                inserted, updated, deleted = store.import_json(path, source)
+                print(f"Imported {path}: {inserted} inserted, {updated} updated, {deleted} deleted")
+        elif args.command == "export":
+            for path in DATASETS:
+                if store.has(path):
+                    store.export(path, os.path.join(ROOT_DIR, path))
+                    print(f"Exported {path}")
+
+
+if __name__ == "__main__":
+    main()
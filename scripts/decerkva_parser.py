@@ -14,16 +14,45 @@ http://decerkva.org.ua
 Результати зберігаються у JSON файл з структурою, що відповідає цій ієрархії.
 """
 
+import argparse
+import os
 import re
-import json
+import threading
+import time
+import data_io
+import http_cache
 import requests
 import logging
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import urljoin, urlparse
 from typing import Optional, Tuple
 
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
+
 MAIN_URL = "http://decerkva.org.ua/"
 
+# Politeness limits of the concurrent crawl: pages downloaded at a time and
+# requests started per second
+DEFAULT_WORKERS = 4
+MAX_REQUESTS_PER_SECOND = 5.0
+
+# Parser of the downloaded pages: lxml when it is installed, BeautifulSoup's
+# pure Python html.parser otherwise
+HTML_BACKEND = "lxml" if lxml_html is not None else "html.parser"
+
+# Finished pages of an interrupted crawl, see CrawlJournal
+JOURNAL_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            ".pipeline", "decerkva_journal.jsonl")
+# Tries per page, waiting RETRY_DELAY seconds after the first failure and twice as long after every next one
+ATTEMPTS = 3
+RETRY_DELAY = 2.0
+
 BROWSER_HEADERS = {
   "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
   "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
@@ -55,39 +84,194 @@ def get_lat_lng(url: str) -> Optional[Tuple[float, float]]:
         return lat, lng
     return None
 
-def download_html_page(full_url, logger):
-    try:
-        response = requests.get(full_url, headers=BROWSER_HEADERS, timeout=10)
+class Fetcher:
+    """
+    Downloads pages over one keep-alive requests.Session shared by the crawl threads.
+    At most max_per_host requests to a host run at a time, and request starts are
+    spaced to stay under rate requests per second (no limit with rate None). With an
+    HttpCache, pages are served from and saved to it. The pages a crawl could not
+    download are collected in failed, keyed by (kind, url) like in a CrawlJournal.
+    """
+
+    def __init__(self, max_per_host=1, rate=None, cache=None):
+        self.session = requests.Session()
+        self.session.headers.update(BROWSER_HEADERS)
+        adapter = HTTPAdapter(pool_maxsize=max_per_host)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.max_per_host = max_per_host
+        self.host_slots = {}
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_start = 0.0
+        self.lock = threading.Lock()
+        self.cache = cache
+        self.failed = {}
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self.host_slots[host]
+
+    def _wait_turn(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def get(self, url, headers=None, timeout=10):
+        with self._host_slot(url):
+            self._wait_turn()
+            return self.session.get(url, headers=headers, timeout=timeout)
+
+    def fail(self, kind, url, error):
+        with self.lock:
+            self.failed[(kind, url)] = error
+
+    def fetch(self, url):
+        """Body of the page, through the cache if there is one."""
+        if self.cache is not None:
+            return self.cache.fetch(url, self.get)
+        response = self.get(url)
         response.raise_for_status()
+        return response.content
+
+
+def download_html_page(full_url, logger, fetcher=None):
+    """
+    The parsed page, or None if it could not be downloaded or parsed. A page missing
+    from the cache in replay mode raises CacheMiss, as trying again cannot help.
+    """
+    try:
+        if fetcher is not None:
+            content = fetcher.fetch(full_url)
+        else:
+            response = requests.get(full_url, headers=BROWSER_HEADERS, timeout=10)
+            response.raise_for_status()
+            content = response.content
         # Specify the website charset to Windows-1251 to fix parsing issues
-        response.encoding = "windows-1251"
-        html_content = response.text
+        html_content = content.decode("windows-1251", errors="replace")
     except requests.RequestException as e:
         logger.error(f"Failed to download HTML content from {full_url}: {e}")
         return None
 
-    soup = BeautifulSoup(html_content, 'html.parser')
-    if not soup:
-        logger.error(f"Failed to parse HTML content from {full_url}")
+    try:
+        page = Page(html_content)
+    except ValueError as e:
+        logger.error(f"Failed to parse HTML content from {full_url}: {e}")
         return None
-    return soup
+    return page
 
 
-def parse_settlement_page(full_url, title, logger):
-    logger.info(f"Parsing region page: {title} ({full_url})")
-    
-    soup = download_html_page(full_url, logger)
-    if soup is None:
-        logger.error(f"download_html_page returned None for {full_url}")
-        return None
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# The elements the crawler reads, as a CSS selector for BeautifulSoup and an XPath for lxml
+SELECTORS = {
+    "links": (".ws28 a", f"//*[{_has_class('ws28')}]//a"),
+    "district_links": (".ws28:has(~ .ws26) a",
+                       f"//*[{_has_class('ws28')}][following-sibling::*[{_has_class('ws26')}]]//a"),
+    "church_name": (".ws36 b", f"//*[{_has_class('ws36')}]//b"),
+    "map_link": ("a[href*='maps']", "//a[contains(@href, 'maps')]"),
+}
+# Compiled XPaths of the SELECTORS, per thread as lxml's XPath objects are not shared between threads
+_xpaths = threading.local()
+
+
+def _xpath(name):
+    compiled = getattr(_xpaths, "compiled", None)
+    if compiled is None:
+        compiled = _xpaths.compiled = {key: etree.XPath(xpath) for key, (_, xpath) in SELECTORS.items()}
+    return compiled[name]
+
+
+class Page:
+    """
+    A downloaded page. With the "lxml" backend the page is parsed by libxml2 and the
+    SELECTORS are evaluated as compiled XPaths without building a Python tree;
+    otherwise BeautifulSoup parses it with the named parser (e.g. "html.parser").
+    """
+
+    def __init__(self, html_content, backend=None):
+        self.backend = backend or HTML_BACKEND
+        if self.backend == "lxml":
+            try:
+                self.root = lxml_html.document_fromstring(html_content)
+            except etree.ParserError as e:
+                raise ValueError(str(e)) from e
+        else:
+            self.root = BeautifulSoup(html_content, self.backend)
+
+    def select(self, name):
+        """(text, href) of the elements matching the selector, in document order."""
+        if self.backend == "lxml":
+            return [
+                ("".join(text.strip() for text in element.itertext()), element.get("href"))
+                for element in _xpath(name)(self.root)
+            ]
+        return [(tag.get_text(strip=True), tag.get("href")) for tag in self.root.select(SELECTORS[name][0])]
+
+    def select_one(self, name):
+        """(text, href) of the first element matching the selector, or None."""
+        if self.backend == "lxml":
+            found = self.select(name)
+            return found[0] if found else None
+        tag = self.root.select_one(SELECTORS[name][0])
+        return (tag.get_text(strip=True), tag.get("href")) if tag is not None else None
+
+
+def region_links(page):
+    """(title, url) of the region pages listed on the main page."""
+    links = []
+    for title, href in page.select("links"):
+        if "область" not in title:
+            continue                        # ← equivalent to the .filter()
+
+        if not href:
+            continue                        # skip <a> without an href
+
+        links.append((title, urljoin(MAIN_URL, href) if MAIN_URL else href))
+    return links
+
+
+def district_links(page, full_url):
+    """(title, url) of the district pages listed on a region page."""
+    links = []
+    for district_title, href in page.select("district_links"):
+        if not href:
+            continue
+        if "menu" in href:
+            continue
+        links.append((district_title, urljoin(full_url, href) if full_url else href))
+    return links
+
+
+def settlement_links(page, full_url):
+    """(title, url) of the settlement pages listed on a district page."""
+    links = []
+    for settelement_title, href in page.select("links"):
+        if not settelement_title:
+            continue
+        if not href:
+            continue
+        if "menu" in href:
+            continue
+        links.append((settelement_title, urljoin(full_url, href) if full_url else href))
+    return links
 
-    # Use select_one to get the first matching element
-    b_tag = soup.select_one(".ws36 b")
-    if not b_tag:
+
+def parse_settlement(page, full_url, title, logger):
+    """Settlement record of a downloaded settlement page, or None without a church name."""
+    church = page.select_one("church_name")
+    if church is None:
         logger.warning(f"No church name found for settlement: {title}")
         return None
     
-    church_name = b_tag.get_text(strip=True)
+    church_name = church[0]
 
     settlement = {
         "name": title,  
@@ -95,13 +279,14 @@ def parse_settlement_page(full_url, title, logger):
         "url": full_url
     }
 
-    map_url = soup.select_one("a[href*='maps']")
-    if not map_url or not map_url.get("href"):
+    map_link = page.select_one("map_link")
+    map_url = map_link[1] if map_link else None
+    if not map_url:
         logger.warning(f"No map URL found for settlement: {title}")
     else:
-        lat_lng = get_lat_lng(map_url.get("href"))
+        lat_lng = get_lat_lng(map_url)
         if not lat_lng:
-            logger.warning(f"Could not extract lat/lng from map URL: {map_url.get('href')} for settlement: {title}")
+            logger.warning(f"Could not extract lat/lng from map URL: {map_url} for settlement: {title}")
             lat_lng = (None, None)
         else:
             logger.info(f"Extracted lat/lng for settlement {title}: {lat_lng}")
@@ -110,24 +295,149 @@ def parse_settlement_page(full_url, title, logger):
     return settlement
 
 
-def parse_district_page(full_url, title, logger):
+class CrawlIncomplete(Exception):
+    """Raised when pages of a crawl still fail after all attempts."""
+
+
+class CrawlJournal:
+    """
+    Append-only JSON lines file of the pages a crawl has finished: the links found on
+    the main, region and district pages and the record parsed from each settlement
+    page, plus the pages that failed. A restarted crawl takes the finished pages from
+    the journal and only fetches the missing and failed ones.
+
+    Pages are keyed by their kind ("main", "region", "district" or "settlement") and
+    URL, as the same URL can be linked as pages of different kinds (e.g. the region
+    page behind the "index.html" link of every district page).
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.done = {}
+        self.failed = {}
+        self.visited = set()
+        self.lock = threading.Lock()
+        line = "\n"
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = data_io.loads(line)
+                    except ValueError:
+                        continue                # the line of an interrupted write
+                    if "kind" not in entry:
+                        continue                # an entry of an older journal without the page kind
+                    key = (entry["kind"], entry["url"])
+                    if "failed" in entry:
+                        self.failed[key] = entry["failed"]
+                    else:
+                        self.done[key] = entry["result"]
+                        self.failed.pop(key, None)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+        if not line.endswith("\n"):
+            self.file.write("\n")              # end the line of an interrupted write
+
+    def _append(self, entry):
+        self.file.write(data_io.dumps(entry) + "\n")
+        self.file.flush()
+
+    def get(self, kind, url):
+        """(True, result) of a finished page, (False, None) otherwise."""
+        with self.lock:
+            self.visited.add((kind, url))
+            if (kind, url) in self.done:
+                return True, self.done[(kind, url)]
+        return False, None
+
+    def record(self, kind, url, result):
+        with self.lock:
+            self.done[(kind, url)] = result
+            self.failed.pop((kind, url), None)
+            self._append({"kind": kind, "url": url, "result": result})
+
+    def fail(self, kind, url, error):
+        with self.lock:
+            self.failed[(kind, url)] = error
+            self._append({"kind": kind, "url": url, "failed": error})
+
+    def prune(self):
+        """
+        Forget the failures of earlier runs on pages this crawl did not reach, i.e.
+        pages that are no longer linked; the ones still linked were retried.
+        """
+        with self.lock:
+            for key in [key for key in self.failed if key not in self.visited]:
+                del self.failed[key]
+
+    def close(self, remove=False):
+        """Close the journal file; remove it once the crawl it belongs to is complete."""
+        self.file.close()
+        if remove:
+            os.remove(self.path)
+
+
+def crawl_page(full_url, kind, extract, logger, fetcher=None, journal=None, attempts=1):
+    """
+    Download the page and return (True, extract(page)), or (False, None) if it still
+    fails after attempts tries, or is not in the cache in replay mode. The failure is
+    recorded in the fetcher. With a journal, a page of this kind it has finished is
+    not downloaded again, and the result or the failure is recorded in it.
+    """
+    if journal is not None:
+        found, result = journal.get(kind, full_url)
+        if found:
+            return True, result
+
+    page = None
+    error = f"failed after {attempts} attempts"
+    for attempt in range(attempts):
+        try:
+            page = download_html_page(full_url, logger, fetcher)
+        except http_cache.CacheMiss as e:
+            logger.error(f"Failed to download HTML content from {full_url}: {e}")
+            error = "not in the page cache"
+            break
+        if page is not None:
+            break
+        if attempt + 1 < attempts:
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+    if page is None:
+        if fetcher is not None:
+            fetcher.fail(kind, full_url, error)
+        if journal is not None:
+            journal.fail(kind, full_url, error)
+        return False, None
+
+    result = extract(page)
+    if journal is not None:
+        journal.record(kind, full_url, result)
+    return True, result
+
+
+def parse_settlement_page(full_url, title, logger, fetcher=None, journal=None, attempts=1):
     logger.info(f"Parsing region page: {title} ({full_url})")
-    soup = download_html_page(full_url, logger)
+    
+    ok, settlement = crawl_page(full_url, "settlement", lambda page: parse_settlement(page, full_url, title, logger),
+                                logger, fetcher, journal, attempts)
+    if not ok:
+        logger.error(f"download_html_page returned None for {full_url}")
+        return None
+
+    return settlement
 
-    district = {district: title, "settlements": []}
-    for a in soup.select(".ws28 a"):
-        settelement_title = a.get_text(strip=True)
-        if not settelement_title:
-            continue
-        href = a.get("href")
-        if not href:
-            continue
-        if "menu" in href:
-            continue
 
-        full_settlement_url = urljoin(full_url, href) if full_url else href
+def parse_district_page(full_url, title, logger, fetcher=None, journal=None, attempts=1):
+    logger.info(f"Parsing region page: {title} ({full_url})")
+    ok, links = crawl_page(full_url, "district", lambda page: settlement_links(page, full_url),
+                           logger, fetcher, journal, attempts)
+    if not ok:
+        logger.error(f"Skipping district {title}: its page could not be downloaded")
+        return None
 
-        settlement = parse_settlement_page(full_settlement_url, settelement_title, logger)
+    district = {"district": title, "settlements": []}
+    for settelement_title, full_settlement_url in links:
+        settlement = parse_settlement_page(full_settlement_url, settelement_title, logger, fetcher, journal, attempts)
         if settlement:
             district["settlements"].append(settlement)
 
@@ -137,22 +447,18 @@ def parse_district_page(full_url, title, logger):
     logger.info(f"Parsed district: {title} with {len(district['settlements'])} settlements")
     return district
 
-def parse_region_page(full_url, title, logger):
+def parse_region_page(full_url, title, logger, fetcher=None, journal=None, attempts=1):
     logger.info(f"Parsing region page: {title} ({full_url})")
-    soup = download_html_page(full_url, logger)
+    ok, links = crawl_page(full_url, "region", lambda page: district_links(page, full_url),
+                           logger, fetcher, journal, attempts)
+    if not ok:
+        logger.error(f"Skipping region {title}: its page could not be downloaded")
+        return None
 
     region = {"region": title, "districts": []}   
 
-    for a in soup.select(".ws28:has(~ .ws26) a"):
-        district_title = a.get_text(strip=True)
-        href = a.get("href")
-        if not href:
-            continue
-        if "menu" in href:
-            continue
-        full_district_url = urljoin(full_url, href) if full_url else href
-        
-        district = parse_district_page(full_district_url, district_title, logger)
+    for district_title, full_district_url in links:
+        district = parse_district_page(full_district_url, district_title, logger, fetcher, journal, attempts)
         if district:
             region["districts"].append(district)
     if not region["districts"]:
@@ -160,43 +466,156 @@ def parse_region_page(full_url, title, logger):
         return None
     logger.info(f"Parsed region: {title} with {len(region['districts'])} districts")
     return region
-    
 
-def parse_decerkva_data(logger):
-    logger.info("Starting to parse decerkva data...")
 
-    soup = download_html_page(MAIN_URL, logger)
-    
+def crawl_decerkva_data(regions, logger, fetcher, workers, journal=None, attempts=1):
+    """
+    Concurrent crawl of the region links of the main page: all region pages are
+    fetched in a pool of workers threads, then all district pages, then all settlement
+    pages. The records are assembled in the order of the links, as the sequential
+    crawl does; pages that failed are left out.
+    """
+    with ThreadPoolExecutor(workers) as pool:
+        def crawl(links, kind, extract):
+            return list(pool.map(
+                lambda link: crawl_page(link[1], kind, lambda page: extract(page, link), logger, fetcher, journal,
+                                        attempts),
+                links))
+
+        region_districts = [
+            links if ok else []
+            for ok, links in crawl(regions, "region", lambda page, link: district_links(page, link[1]))
+        ]
+        districts = [link for links in region_districts for link in links]
+        district_settlements = [
+            links if ok else []
+            for ok, links in crawl(districts, "district", lambda page, link: settlement_links(page, link[1]))
+        ]
+        settlements = [link for links in district_settlements for link in links]
+        parsed = crawl(settlements, "settlement", lambda page, link: parse_settlement(page, link[1], link[0], logger))
+        parsed = iter(settlement for _, settlement in parsed)
+
+    districts = iter(zip(districts, district_settlements))
     records = []
-    for a in soup.select(".ws28 a"):
-        title = a.get_text(strip=True)
-        if "область" not in title:
-            continue                        # ← equivalent to the .filter()
+    for (title, _), links in zip(regions, region_districts):
+        region = {"region": title, "districts": []}
+        for _ in links:
+            (district_title, _), page_links = next(districts)
+            district = {"district": district_title, "settlements": []}
+            for _ in page_links:
+                settlement = next(parsed)
+                if settlement:
+                    district["settlements"].append(settlement)
+            if not district["settlements"]:
+                logger.warning(f"No settlements found for district: {district_title}")
+                continue
+            logger.info(f"Parsed district: {district_title} with {len(district['settlements'])} settlements")
+            region["districts"].append(district)
+        if not region["districts"]:
+            logger.warning(f"No districts found for region: {title}")
+            continue
+        logger.info(f"Parsed region: {title} with {len(region['districts'])} districts")
+        records.append(region)
+    return records
 
-        href = a.get("href")
-        if not href:
-            continue                        # skip <a> without an href
 
-        full_url = urljoin(MAIN_URL, href) if MAIN_URL else href
+def parse_decerkva_data(logger, workers=DEFAULT_WORKERS, rate=MAX_REQUESTS_PER_SECOND, cache=None,
+                        journal=None, attempts=ATTEMPTS):
+    """
+    Crawl decerkva. With workers > 1 the pages are fetched concurrently, at most
+    workers at a time and rate per second; otherwise one by one, depth first. With an
+    HttpCache the pages are only downloaded if they are not cached or have changed.
+
+    Every page is tried up to attempts times. When some pages still fail,
+    CrawlIncomplete is raised instead of returning the incomplete records. With a
+    CrawlJournal the crawl continues where an interrupted one stopped; the journal is
+    removed when every page has been crawled and kept, for a rerun to retry the failed
+    pages, otherwise.
+    """
+    logger.info("Starting to parse decerkva data...")
+
+    fetcher = Fetcher(max_per_host=max(workers, 1), rate=rate if workers > 1 else None, cache=cache)
+    if journal is not None and journal.done:
+        logger.warning(f"Resuming the crawl from {journal.path}: {len(journal.done)} pages done, "
+                       f"{len(journal.failed)} to retry")
+
+    records = []
+    complete = False
+    try:
+        ok, regions = crawl_page(MAIN_URL, "main", region_links, logger, fetcher, journal, attempts)
+        if not ok:
+            logger.error(f"Failed to download the main page {MAIN_URL}")
+        elif workers > 1:
+            records = crawl_decerkva_data(regions, logger, fetcher, workers, journal, attempts)
+        else:
+            for title, full_url in regions:
+                region = parse_region_page(full_url, title, logger, fetcher, journal, attempts)
+                if region:
+                    records.append(region)
+        complete = ok
+    finally:
+        # An interrupted crawl keeps its journal whole, to continue from it
+        if journal is not None:
+            if complete:
+                journal.prune()
+            journal.close(remove=complete and not journal.failed)
 
-        region = parse_region_page(full_url, title, logger)
-        if region:
-            records.append(region)
     logger.info(f"Parsed {len(records)} regions with churches.")
+    if cache is not None:
+        logger.info(f"Page cache: {cache.stats}")
+    failed = journal.failed if journal is not None else fetcher.failed
+    if failed:
+        if journal is not None:
+            logger.error(f"{len(failed)} pages failed, run the crawl again to retry them (journal: {journal.path}):")
+        else:
+            logger.error(f"{len(failed)} pages failed:")
+        for (kind, url), error in failed.items():
+            logger.error(f"  {kind} page {url}: {error}")
+        raise CrawlIncomplete(f"{len(failed)} pages failed, the crawl is incomplete")
     return records
 
     
 
 def main():
+    parser = argparse.ArgumentParser(description="Crawl the churches of decerkva.org.ua.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, metavar="N",
+                        help="pages to download at a time, 1 to crawl sequentially (default: %(default)s)")
+    parser.add_argument("--rate", type=float, default=MAX_REQUESTS_PER_SECOND, metavar="N",
+                        help="at most N requests per second in a concurrent crawl (default: %(default)s)")
+    parser.add_argument("--cache-dir", default=http_cache.HTTP_CACHE_DIR, metavar="DIR",
+                        help="where to keep the downloaded pages (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true", help="download every page without the cache")
+    parser.add_argument("--max-age", type=float, metavar="SECONDS",
+                        help="use cached pages younger than this without asking the server (default: always revalidate)")
+    parser.add_argument("--replay", action="store_true",
+                        help="only use the cached pages, without network access")
+    parser.add_argument("--attempts", type=int, default=ATTEMPTS, metavar="N",
+                        help="tries per page before it counts as failed (default: %(default)s)")
+    parser.add_argument("--journal", default=JOURNAL_FILE, metavar="FILE",
+                        help="where to checkpoint the finished pages to resume an interrupted crawl "
+                             "(default: %(default)s)")
+    parser.add_argument("--no-journal", action="store_true", help="crawl without checkpoints")
+    parser.add_argument("--restart", action="store_true",
+                        help="discard the journal of an earlier crawl and start from the main page")
+    args = parser.parse_args()
+    if args.replay and args.no_cache:
+        parser.error("--replay needs the cache")
+
     output_file = "data/decerkva.json"
     logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
     logger = logging.getLogger(__name__)
     logger.info("Starting decerkva data parsing...")
     
-    churches = parse_decerkva_data(logger)
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(churches, f, ensure_ascii=False, indent=4)
+    cache = None if args.no_cache else http_cache.HttpCache(args.cache_dir, args.max_age, args.replay)
+    if args.restart and os.path.exists(args.journal):
+        os.remove(args.journal)
+    journal = None if args.no_journal else CrawlJournal(args.journal)
+    try:
+        churches = parse_decerkva_data(logger, args.workers, args.rate, cache, journal, args.attempts)
+    except CrawlIncomplete as e:
+        parser.exit(1, f"{e}; {output_file} is not updated, run the crawl again to retry the failed pages\n")
+    data_io.write_json(output_file, churches, indent=4)
     print(f"Decerkva data saved to {output_file}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
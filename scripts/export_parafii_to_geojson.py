@@ -1,20 +1,16 @@
 import csv
-import json
+import data_io
 import logging
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
-def export_parafii(locations_mapping_path, parafii_path, output_path):
-    with open(parafii_path, 'r', encoding='utf-8') as f:
-        parafii = json.load(f)
-    
+def load_locations_mapping(locations_mapping_path):
     # Load locations mapping using 'id' as the key
     with open(locations_mapping_path, 'r', encoding='utf-8') as f:
-        locations_mapping = {row['id']: row for row in csv.DictReader(f)}
-    logger.info(f"Loaded {len(parafii)} parafii from {parafii_path}")
-    logger.info(f"Loaded {len(locations_mapping)} locations from mapping file")
+        return {row['id']: row for row in csv.DictReader(f)}
 
+def build_geojson(parafii, locations_mapping):
     # Prepare GeoJSON features             
     features = []
 
@@ -57,12 +53,21 @@ def export_parafii(locations_mapping_path, parafii_path, output_path):
        
         features.append(feature)
     # Build the GeoJSON FeatureCollection
-    geojson = {
+    return {
         "type": "FeatureCollection",
         "features": features
     }
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(geojson, f, ensure_ascii=False, indent=2)
+
+def export_parafii(locations_mapping_path, parafii_path, output_path):
+    parafii = data_io.read_json(parafii_path)
+    
+    locations_mapping = load_locations_mapping(locations_mapping_path)
+    logger.info(f"Loaded {len(parafii)} parafii from {parafii_path}")
+    logger.info(f"Loaded {len(locations_mapping)} locations from mapping file")
+
+    geojson = build_geojson(parafii, locations_mapping)
+    features = geojson["features"]
+    data_io.write_json(output_path, geojson, indent=2)
     logger.info(f"Wrote {len(features)} records to {output_path}")
     
 
@@ -1,13 +1,12 @@
 import csv
-import json
+import data_io
 import logging
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
 def group_parafii(locations_mapping_path, parafii_path):
-    with open(parafii_path, 'r', encoding='utf-8') as f:
-        parafii = json.load(f)
+    parafii = data_io.read_json(parafii_path)
     
     # Load locations mapping using 'id' as the key
     with open(locations_mapping_path, 'r', encoding='utf-8') as f:
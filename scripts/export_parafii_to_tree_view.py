@@ -1,13 +1,12 @@
 import csv
-import json
+import data_io
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def generate_tree_view(parafii_path):
-    with open(parafii_path, 'r', encoding='utf-8') as f:
-        parafii = json.load(f)
+    parafii = data_io.read_json(parafii_path)
     
     regions = []
     for parafia in parafii:
@@ -70,8 +69,7 @@ def main():
         logger.error("No parafii found in the provided file.")
         return
     logger.info(f"Generated tree view with {len(tree_vew)} regions.")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(tree_vew, f, ensure_ascii=False, indent=4)
+    data_io.write_json(output_path, tree_vew, indent=4)
 
     logger.info(f"Tree view saved to {output_path}")
 
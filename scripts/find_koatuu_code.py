@@ -1,5 +1,18 @@
+import argparse
 import csv
-import json
+import hashlib
+import os
+import pickle
+from array import array
+from bisect import bisect_left
+from collections import Counter
+import data_io
+import sharding
+
+# Parsed and indexed KOATUU tables, keyed by the content hash of the CSV file
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".pipeline", "cache")
+# Bump when KoatuuIndex changes, so older cache files are not loaded
+INDEX_VERSION = 3
 
 # Mapping for type letters to full names
 TYPE_MAPPING = {"С": "село","C": "село","X": "селище","X": "селище", "Щ": "селище", "Т": "селище","T": "селище", "М": "місто", "К": "місто","M": "місто", "K": "місто"}
@@ -31,6 +44,27 @@ def meaningful_prefix(code):
     """
     return code.rstrip("0")
 
+# KOATUU codes are 10 digits: oblast (2), rayon or city (3), settlement (5)
+CODE_DIGITS = 10
+
+def parse_code(code):
+    """Integer value of a KOATUU code, or None if it is not CODE_DIGITS digits."""
+    code = code or ""
+    return int(code) if len(code) == CODE_DIGITS and code.isascii() and code.isdigit() else None
+
+def code_range(prefix):
+    """
+    Integer range [low, high) of the codes starting with the prefix: with fixed-width
+    codes "all descendants of the prefix" is a contiguous range of the sorted codes.
+    No code starts with a prefix of other characters than digits or longer than a
+    code, so the range of such a prefix is empty.
+    """
+    if prefix and not (len(prefix) <= CODE_DIGITS and prefix.isascii() and prefix.isdigit()):
+        return 0, 0
+    scale = 10 ** (CODE_DIGITS - len(prefix))
+    low = int(prefix) * scale if prefix else 0
+    return low, low + scale
+
 def get_csv_primary_name(rec_name):
     """
     Extract the primary name from the CSV record's name.
@@ -38,34 +72,130 @@ def get_csv_primary_name(rec_name):
     """
     return rec_name.split("/")[0].strip()
 
-def find_record_by_name(records, name):
+def primary_name(rec):
+    """Normalized primary name of a CSV record."""
+    return normalize_text(get_csv_primary_name(rec.get("NU", "")))
+
+class KoatuuIndex:
     """
-    Search for a record in CSV records whose normalized primary name exactly matches the given name.
+    Columnar index of the CSV records from load_csv(), built once.
+
+    Codes are kept as a sorted int64 array (with the CSV positions of the records as a
+    parallel array), so the records under a code prefix are a bisect range slice. The
+    same layout is kept per normalized primary name, so a (prefix, name, type) lookup
+    bisects the codes of that name only; every lookup is memoized. A lookup returns the
+    first match in CSV order, the same record a scan of the whole table would find.
+    Records without a valid code (see parse_code) are left out of the index.
     """
-    norm_name = normalize_text(name)
-    for rec in records:
-        rec_primary = get_csv_primary_name(rec.get("NU", ""))
-        if normalize_text(rec_primary) == norm_name:
-            return rec
-    return None
 
-def find_record_by_prefix_and_name(records, prefix, name,type=None):
+    def __init__(self, records):
+        self.records = records
+        valid = [position for position, rec in enumerate(records) if parse_code(rec.get("TE")) is not None]
+        if len(valid) < len(records):
+            print(f"Skipping {len(records) - len(valid)} KOATUU records with a malformed code")
+        self.codes, self.positions = self._columns(valid)
+        groups = {}
+        for position in valid:
+            groups.setdefault(primary_name(records[position]), []).append(position)
+        self.by_name = {name: self._columns(positions) for name, positions in groups.items()}
+        self.lookups = {}
+        self.trigram_indexes = {}
+
+    def __getstate__(self):
+        # Trigram indexes are built on demand and not worth caching on disk
+        state = dict(self.__dict__)
+        state["trigram_indexes"] = {}
+        return state
+
+    def _columns(self, positions):
+        """Sorted codes of the records at the positions and the positions in the same order."""
+        keyed = sorted((parse_code(self.records[position].get("TE")), position) for position in positions)
+        return array("q", (code for code, _ in keyed)), array("l", (position for _, position in keyed))
+
+    @staticmethod
+    def _slice(columns, prefix):
+        codes, positions = columns
+        low, high = code_range(prefix)
+        return positions[bisect_left(codes, low):bisect_left(codes, high)]
+
+    def records_under(self, prefix):
+        """Records whose code starts with the meaningful prefix of the given code, in code order."""
+        return [self.records[position] for position in self._slice((self.codes, self.positions), meaningful_prefix(prefix))]
+
+    def similar(self, prefix, name, limit=5):
+        """
+        Settlement records under the prefix with names similar to the given one, as
+        (score, record) pairs, best first. The trigram index of the oblast is built on first use.
+        """
+        prefix = meaningful_prefix(prefix)
+        oblast = prefix[:2]
+        if oblast not in self.trigram_indexes:
+            self.trigram_indexes[oblast] = TrigramIndex(self.records_under(oblast))
+        return self.trigram_indexes[oblast].search(name, prefix, limit)
+
+    def find_by_name(self, name):
+        """Return the first record whose normalized primary name exactly matches the given name."""
+        columns = self.by_name.get(normalize_text(name))
+        return self.records[min(columns[1])] if columns else None
+
+    def find_by_prefix_and_name(self, prefix, name, type=None):
+        """
+        Return the first record whose 'code' starts with the meaningful prefix
+        (obtained by removing trailing zeros), whose normalized primary name exactly
+        matches and, if type is given, whose type letter equals it.
+        """
+        key = (meaningful_prefix(prefix), normalize_text(name), type)
+        if key not in self.lookups:
+            self.lookups[key] = self._find(*key)
+        return self.lookups[key]
+
+    def _find(self, prefix, norm_name, type):
+        columns = self.by_name.get(norm_name)
+        if not columns:
+            return None
+        matches = [
+            position for position in self._slice(columns, prefix)
+            if not type or self.records[position].get("NP", "") == type
+        ]
+        return self.records[min(matches)] if matches else None
+
+def name_trigrams(name):
+    """Character trigrams of the normalized name, padded so the start and end of the name count."""
+    padded = f"  {normalize_text(name)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TrigramIndex:
     """
-    Search for a record in CSV records whose 'code' starts with the meaningful prefix
-    (obtained by removing trailing zeros) and whose normalized primary name exactly matches.
+    Inverted index from name trigrams to the settlement records (the ones with a type
+    letter) of one part of the KOATUU table, for ranking near matches of a name.
     """
-    norm_name = normalize_text(name)
-    prefix = meaningful_prefix(prefix)
-    for rec in records:
-        code = rec.get("TE", "")
-        rec_primary = get_csv_primary_name(rec.get("NU", ""))
-        # Check if the record type matches the provided type (if any)
-        # If type is provided, check if it matches the record's type
-        if(type and rec.get("NP", "") != type):
-            continue
-        if code.startswith(prefix) and normalize_text(rec_primary) == norm_name:
-            return rec
-    return None
+
+    def __init__(self, records):
+        self.records = [rec for rec in records if rec.get("NP", "")]
+        self.codes = [parse_code(rec.get("TE")) for rec in self.records]
+        self.sizes = []
+        self.postings = {}
+        for i, rec in enumerate(self.records):
+            grams = name_trigrams(get_csv_primary_name(rec.get("NU", "")))
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(i)
+
+    def search(self, name, prefix="", limit=5):
+        """
+        Return up to limit (score, record) pairs under the code prefix, best first. The
+        score is the Dice coefficient of the trigram sets (1.0 for the same name).
+        """
+        grams = name_trigrams(name)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        low, high = code_range(meaningful_prefix(prefix))
+        ranked = sorted(
+            (-2 * count / (len(grams) + self.sizes[i]), i)
+            for i, count in shared.items() if low <= self.codes[i] < high
+        )
+        return [(round(-score, 3), self.records[i]) for score, i in ranked[:limit]]
 
 def load_csv(filename):
     """
@@ -80,119 +210,306 @@ def load_csv(filename):
             records.append(row)
     return records
 
-def update_settlements(settlements, csv_records):
+def load_index(filename, cache_dir=CACHE_DIR):
     """
-    For each settlement record, update its old_district with the matching KOATUU code
-    and type. Caches oblast and rayon lookups to avoid repeated searches.
+    Return the KoatuuIndex of the CSV file. The index is pickled to cache_dir under the
+    SHA-256 of the file content and loaded from there while the file is unchanged.
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    cache_file = os.path.join(cache_dir, f"koatuu-v{INDEX_VERSION}-{digest.hexdigest()}.pickle")
+
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            print(f"Ignoring unreadable KOATUU cache {cache_file}: {e}")
+
+    # Pickle the class of the importable module, also when this file runs as a script,
+    # so the cache can be loaded by master.py too
+    from find_koatuu_code import KoatuuIndex as Index
+    index = Index(load_csv(filename))
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+    return index
+
+def settlement_key(settlement):
     """
-    oblast_cache = {}  # Cache: normalized oblast name -> oblast record
-    rayon_cache = {}   # Cache: (oblast_code, normalized rayon name) -> rayon record
+    Normalized (title, oblast, rayon, name, type) of a settlement to resolve, or None for
+    settlements without old_district or outside Ukraine. The type restricts the
+    oblast-level fallback to cities when the title mentions "м.".
+    """
+    old_district = settlement.get("old_district", {})
+    if not old_district:
+        return None
 
-    for settlement in settlements:
-        old_district = settlement.get("old_district", {})
-        if not old_district:
-            continue
+    country = old_district.get("country", "")
+    if country and "україна" not in country.lower():
+        return None
+
+    title = old_district.get("title", "")
+    rayon_raw = old_district.get("rayon", "")
+    return (
+        title,
+        normalize_oblast(old_district.get("oblast", "")),
+        normalize_rayon(rayon_raw) if rayon_raw else None,
+        old_district.get("name", "").strip(),
+        "М" if "м." in title else None,
+    )
+
+def resolve_settlements(settlements, index):
+    """
+    Resolve the KOATUU records of all settlements in one batch: the settlement keys are
+    normalized once and every distinct oblast, rayon and (prefix, name) is joined
+    against the index once. Settlements not found under their rayon go through a
+    second pass looking for the name in the whole oblast.
 
-        # Extract raw fields
-        title = old_district.get("title", "")
-        country = old_district.get("country", "")
-        oblast_raw = old_district.get("oblast", "")
-        rayon_raw = old_district.get("rayon", "")
-        settlement_name = old_district.get("name", "").strip()
+    Returns, aligned with settlements, None for skipped settlements and otherwise
+    (key, oblast record, rayon record, prefix, settlement record).
+    """
+    keys = [settlement_key(settlement) for settlement in settlements]
 
-        # Normalize oblast and rayon names for matching
-        norm_oblast = normalize_oblast(oblast_raw)
-        norm_rayon = normalize_rayon(rayon_raw) if rayon_raw else None
+    oblasts = {key[1] for key in keys if key}
+    oblast_recs = {oblast: index.find_by_name(oblast) for oblast in oblasts}
 
-        if country and "україна" not in country.lower():
-            continue
+    rayons = {
+        (oblast_recs[key[1]].get("TE", ""), key[2])
+        for key in keys if key and key[2] and oblast_recs[key[1]]
+    }
+    rayon_recs = {rayon: index.find_by_prefix_and_name(*rayon) for rayon in rayons}
 
-        # Lookup oblast record (using cache)
-        if norm_oblast in oblast_cache:
-            oblast_rec = oblast_cache[norm_oblast]
-        else:
-            oblast_rec = find_record_by_name(csv_records, norm_oblast)
-            if oblast_rec:
-                oblast_cache[norm_oblast] = oblast_rec
-        if not oblast_rec:
-            print(f"Oblast record not found for: {norm_oblast} with title {title}")
+    rows = []
+    for key in keys:
+        if not key:
+            rows.append(None)
             continue
+        oblast_rec = oblast_recs[key[1]]
+        oblast_code = oblast_rec.get("TE", "") if oblast_rec else None
+        rayon_rec = rayon_recs[(oblast_code, key[2])] if oblast_rec and key[2] else None
+        prefix = rayon_rec.get("TE", "") if rayon_rec else oblast_code
+        rows.append([key, oblast_rec, rayon_rec, prefix, None])
+
+    # Settlements whose oblast (and rayon, if given) were found
+    resolvable = [row for row in rows if row and row[1] and (row[2] or not row[0][2])]
+
+    names = {(row[3], row[0][3]) for row in resolvable}
+    settlement_recs = {name: index.find_by_prefix_and_name(*name) for name in names}
+    for row in resolvable:
+        row[4] = settlement_recs[(row[3], row[0][3])]
+
+    # Second pass over the unmatched remainder: the name anywhere in the oblast
+    unmatched = [row for row in resolvable if not row[4]]
+    fallbacks = {(row[1].get("TE", ""), row[0][3], row[0][4]) for row in unmatched}
+    fallback_recs = {fallback: index.find_by_prefix_and_name(*fallback) for fallback in fallbacks}
+    for row in unmatched:
+        row[4] = fallback_recs[(row[1].get("TE", ""), row[0][3], row[0][4])]
+
+    return [tuple(row) if row else None for row in rows]
+
+def fuzzy_match(index, prefix, settlement_name, title, threshold):
+    """
+    Look for a settlement record with a similar name under the prefix. The best candidate
+    is accepted if its score reaches the threshold and no other candidate scores the same.
+    Returns (accepted record or None, report entry).
+    """
+    candidates = index.similar(prefix, settlement_name)
+    best = candidates[0] if candidates else None
+    accepted = (
+        best is not None and best[0] >= threshold
+        and (len(candidates) == 1 or candidates[1][0] < best[0])
+    )
+    entry = {
+        "name": settlement_name,
+        "title": title,
+        "prefix": prefix,
+        "accepted": accepted,
+        "candidates": [
+            {"name": rec.get("NU", ""), "koatuu": rec.get("TE", ""), "type": rec.get("NP", ""), "score": score}
+            for score, rec in candidates
+        ],
+    }
+    return (best[1] if accepted else None), entry
+
+def apply_settlement(settlement, row, index, fuzzy_threshold=None):
+    """
+    Update the settlement with its resolved KOATUU record (row from resolve_settlements).
+    Returns the messages to print about it and its fuzzy report entry, if any.
+    """
+    if not row:
+        return [], None
+    (title, norm_oblast, norm_rayon, settlement_name, _), oblast_rec, rayon_rec, prefix, settlement_rec = row
+
+    if not oblast_rec:
+        return [f"Oblast record not found for: {norm_oblast} with title {title}"], None
+    if norm_rayon and not rayon_rec:
+        return [f"Rayon record not found for: {norm_rayon} with title {title}"], None
+
+    messages, entry = [], None
+    if not settlement_rec and fuzzy_threshold is not None:
+        settlement_rec, entry = fuzzy_match(index, prefix, settlement_name, title, fuzzy_threshold)
+        if settlement_rec:
+            messages.append(f"Fuzzy match for: {settlement_name}: {settlement_rec.get('NU', '')} "
+                            f"(score {entry['candidates'][0]['score']}), title {title}")
 
-        oblast_code = oblast_rec.get("TE", "")
-
-        # If rayon is provided, lookup rayon record (using cache)
-        if norm_rayon:
-            key = (oblast_code, norm_rayon)
-            if key in rayon_cache:
-                rayon_rec = rayon_cache[key]
-            else:
-                rayon_rec = find_record_by_prefix_and_name(csv_records, oblast_code, norm_rayon)
-                if rayon_rec:
-                    rayon_cache[key] = rayon_rec
-            
-            if not rayon_rec:
-                print(f"Rayon record not found for: {norm_rayon} with title {title}")
-                continue
-            prefix = rayon_rec.get("TE", "") if rayon_rec else oblast_code
-        else:
-            prefix = oblast_code
-
-        # Find settlement record by searching for a code that starts with the prefix
-        # and matching the settlement name.
-        settlement_rec = find_record_by_prefix_and_name(csv_records, prefix, settlement_name)
-        if not settlement_rec:
-             # If the settlement name contains "м.", try to find city it in oblast directly
-            # This is a workaround for cases where the settlement name is not found in the rayon.
-            oblast_settlement_rec = find_record_by_prefix_and_name(csv_records, oblast_code, settlement_name, "М" if "м." in title else None)
-            if(oblast_settlement_rec):
-                settlement_rec = oblast_settlement_rec
-                #print(f"Settlement record ONLY found in oblast for: {settlement_name} with prefix: {oblast_code}, title {title}")
+    if settlement_rec:
+        old_district = settlement["old_district"]
+        # Save the full KOATUU code and mapped type into old_district.
+        old_district["koatuu"] = settlement_rec.get("TE", "")
+        katotth = settlement_rec.get("Код об’єкта Кодифікатора", "")
 
-        if settlement_rec:
-            # Save the full KOATUU code and mapped type into old_district.
-            old_district["koatuu"] = settlement_rec.get("TE", "")
-            katotth = settlement_rec.get("Код об’єкта Кодифікатора", "")
+        type_letter = settlement_rec.get("NP", "")
+        old_district["type"] = TYPE_MAPPING.get(type_letter, type_letter)
 
-            type_letter = settlement_rec.get("NP", "")
-            old_district["type"] = TYPE_MAPPING.get(type_letter, type_letter)
+        if(katotth):
+            new_district={'katotth':katotth}
+            new_type_letter = settlement_rec.get("Категорія об’єкта Кодифікатора", "")
+            new_district["type"] = TYPE_MAPPING.get(new_type_letter, type_letter)
+            settlement["new_district"] = new_district
+    else:
+        messages.append(f"Settlement record not found for: {settlement_name} with prefix: {prefix}, title {title}")
 
-            if(katotth):
-                new_district={'katotth':katotth}
-                new_type_letter = settlement_rec.get("Категорія об’єкта Кодифікатора", "")
-                new_district["type"] = TYPE_MAPPING.get(new_type_letter, type_letter)
-                settlement["new_district"] = new_district
+    return messages, entry
 
-            
-        else:
-            print(f"Settlement record not found for: {settlement_name} with prefix: {prefix}, title {title}")
+def apply_settlements(settlements, index, fuzzy_threshold=None):
+    rows = resolve_settlements(settlements, index)
+    return [apply_settlement(settlement, row, index, fuzzy_threshold) for settlement, row in zip(settlements, rows)]
+
+def update_shard(settlements, records, fuzzy_threshold=None):
+    """
+    Worker of a sharded update_settlements(): resolves the settlements of one oblast
+    against the KOATUU records under the oblast code only. Returns the updated
+    settlements with their messages and fuzzy report entries.
+    """
+    results = apply_settlements(settlements, KoatuuIndex(records), fuzzy_threshold)
+    return list(zip(settlements, results))
+
+def shard_settlements(settlements, csv_records):
+    """
+    Split the settlements by the meaningful prefix of their oblast code (every lookup for
+    a settlement stays under it) and select the records under every prefix. Rows from
+    load_csv() are split in one pass, without building the index of the whole table.
+    Returns {prefix: (positions, records)}; prefix None holds the settlements with no
+    oblast to resolve.
+    """
+    keys = [settlement_key(settlement) for settlement in settlements]
+    oblasts = {key[1] for key in keys if key}
+
+    if isinstance(csv_records, list):
+        # Leave out the records KoatuuIndex would not index
+        valid = [rec for rec in csv_records if parse_code(rec.get("TE")) is not None]
+        if len(valid) < len(csv_records):
+            print(f"Skipping {len(csv_records) - len(valid)} KOATUU records with a malformed code")
+        csv_records = valid
+        # First record with each oblast name, as KoatuuIndex.find_by_name would return
+        oblast_recs = {}
+        for rec in csv_records:
+            name = primary_name(rec)
+            if name in oblasts and name not in oblast_recs:
+                oblast_recs[name] = rec
+    else:
+        oblast_recs = {oblast: csv_records.find_by_name(oblast) for oblast in oblasts}
+
+    prefixes = []
+    for key in keys:
+        oblast_rec = oblast_recs.get(key[1]) if key else None
+        prefixes.append(meaningful_prefix(oblast_rec.get("TE", "")) if oblast_rec else None)
+
+    shards = {prefix: (positions, []) for prefix, positions in sharding.group_positions(prefixes).items()}
+    if isinstance(csv_records, list):
+        lengths = {len(prefix) for prefix in shards if prefix is not None}
+        for rec in csv_records:
+            code = rec.get("TE", "")
+            for length in lengths:
+                if code[:length] in shards:
+                    shards[code[:length]][1].append(rec)
+    else:
+        for prefix, (_, records) in shards.items():
+            if prefix is not None:
+                records.extend(csv_records.records_under(prefix))
+    return shards
+
+def update_settlements(settlements, csv_records, fuzzy_threshold=None, fuzzy_report=None, jobs=1):
+    """
+    For each settlement record, update its old_district with the matching KOATUU code
+    and type. csv_records are the rows from load_csv() or a KoatuuIndex built from them.
+
+    With fuzzy_threshold, settlements without an exact match take the most similar name
+    under their rayon (or oblast) if it scores at least the threshold; every attempt is
+    appended to the fuzzy_report list.
+
+    With jobs > 1 the settlements are sharded by oblast and resolved in that many worker
+    processes, each getting only the KOATUU records of its oblast; the result is the same.
+    """
+    if jobs > 1:
+        shards = {
+            prefix: (positions, ([settlements[position] for position in positions], records, fuzzy_threshold))
+            for prefix, (positions, records) in shard_settlements(settlements, csv_records).items()
+        }
+        results = []
+        for position, (settlement, result) in enumerate(sharding.run_shards(update_shard, shards, jobs)):
+            settlements[position] = settlement
+            results.append(result)
+    else:
+        index = KoatuuIndex(csv_records) if isinstance(csv_records, list) else csv_records
+        results = apply_settlements(settlements, index, fuzzy_threshold)
+
+    for messages, entry in results:
+        for message in messages:
+            print(message)
+        if entry and fuzzy_report is not None:
+            fuzzy_report.append(entry)
 
     return settlements
 
+def find_settlements_koatuu(settlements, csv_records, fuzzy_threshold=None, fuzzy_report=None, jobs=1):
+    """
+    Update settlements with matching KOATUU codes and types and keep only the ones
+    that have a koatuu code in their old_district or an OSM id.
+    """
+    updated_settlements = update_settlements(settlements, csv_records, fuzzy_threshold, fuzzy_report, jobs)
+
+    return [
+        s for s in updated_settlements
+        if "koatuu" in s.get("old_district", {}) or "osm_id" in s
+    ]
+
 def main():
+    parser = argparse.ArgumentParser(description="Find KOATUU codes of the parsed settlements.")
+    parser.add_argument("--fuzzy", type=float, metavar="THRESHOLD",
+                        help="accept the most similar name (score 0-1, e.g. 0.8) for settlements without an exact match")
+    parser.add_argument("--jobs", "-j", type=int, default=1, metavar="N",
+                        help="resolve the settlements of different oblasts in N worker processes (default: 1)")
+    parser.add_argument("--fuzzy-report", default="data/koatuu_fuzzy_matches.json", metavar="FILE",
+                        help="where to save the fuzzy candidates for review (default: %(default)s)")
+    args = parser.parse_args()
+
     settlements_file = "data/parsed_settlements.json"
     koatuu_csv_file = "data/source/Перехідна таблиця з КОАТУУ на Кодифікатор.csv"
     output_file = "data/settlements_locations.json"
 
     # Load settlements JSON data
-    with open(settlements_file, "r", encoding="utf-8") as f:
-        settlements = json.load(f)
+    settlements = data_io.read_json(settlements_file)
 
-    # Load KOATUU CSV data
-    csv_records = load_csv(koatuu_csv_file)
+    # Load KOATUU CSV data (indexed, from the cache when the file is unchanged)
+    csv_records = load_index(koatuu_csv_file)
 
     # Update settlements with matching KOATUU codes and types
-    updated_settlements = update_settlements(settlements, csv_records)
-
-    # Filter only settlements that have a koatuu code in their old_district or OSM id 
-    settlements_with_koatuu = [
-        s for s in updated_settlements
-        if "koatuu" in s.get("old_district", {}) or "osm_id" in s
-    ]
-
+    fuzzy_report = []
+    settlements_with_koatuu = find_settlements_koatuu(settlements, csv_records, args.fuzzy, fuzzy_report, args.jobs)
 
     # Save updated settlements to a new JSON file
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(settlements_with_koatuu, f, ensure_ascii=False, indent=2)
+    data_io.write_json(output_file, settlements_with_koatuu)
+
+    if args.fuzzy is not None:
+        data_io.write_json(args.fuzzy_report, fuzzy_report, indent=2)
+        accepted = sum(entry["accepted"] for entry in fuzzy_report)
+        print(f"Fuzzy matching accepted {accepted} of {len(fuzzy_report)} settlements, report saved to {args.fuzzy_report}")
 
     print(f"Updated settlements with koatuu code saved to {output_file}")
 
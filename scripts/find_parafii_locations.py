@@ -1,100 +1,295 @@
-import json
+import argparse
+import data_io
+import hashlib
+import os
 import re
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump when the format of the cache file changes
+MATCH_CACHE_VERSION = 1
+MATCH_CACHE_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ".pipeline", "cache", f"parafii-matches-v{MATCH_CACHE_VERSION}.json")
+
+def source_digest(path=__file__):
+    """SHA-256 of the matching code, so the matches of an earlier version are not reused."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+MATCH_CODE_VERSION = source_digest()
+
+# Catalog entry fields the match depends on
+MATCH_FIELDS = ('church_settlement', 'page', 'territory', 'povit', 'volost', 'gmina')
+# Settlement fields the match and its report entry depend on, besides the historic
+# district and whether it has a location
+CANDIDATE_FIELDS = ('name', 'title', 'osm_id', 'pages')
+
 def normalize_territory(territory: str) -> str:
     # прибираємо суфікс "губернія" або "губ."
     return re.sub(r'\s*губерн(?:ія|\.?)$', '', territory).strip()
 
-def match_entry(catalog_entry, locations):
+# Features a candidate settlement is scored on, in order of priority, with their weights.
+# "page" means the settlement is listed on the entry's own page (not only next to it),
+# the others that the historic district title contains the entry's povit, volost or territory.
+# The score only ranks the candidates in the match report; select_candidates picks the
+# settlement by the features themselves.
+FEATURES = (("page", 8), ("povit", 4), ("volost", 2), ("territory", 1))
+
+def entry_fields(catalog_entry):
+    """Normalized fields of a catalog entry the candidates are scored against."""
+    return {
+        "page": catalog_entry['page'],
+        "povit": catalog_entry.get('povit', '').lower(),
+        "volost": catalog_entry.get('volost', catalog_entry.get('gmina', '')).lower(),
+        "territory": normalize_territory(catalog_entry['territory']).lower(),
+    }
+
+def score_candidates(fields, ids, index):
+    """Score every candidate (position in the index) on all features in one pass."""
+    scored = []
+    for i in ids:
+        district = index.districts[i]
+        features = {
+            "page": fields["page"] in index.locations[i].get('pages', []),
+            "povit": fields["povit"] in district,
+            "volost": fields["volost"] in district,
+            "territory": fields["territory"] in district,
+        }
+        score = sum(weight for feature, weight in FEATURES if features[feature])
+        scored.append({"position": i, "score": score, "features": features})
+    return scored
+
+def select_candidates(scored, fields):
+    """
+    Narrow the scored candidates down feature by feature while more than one is left.
+    A settlement listed on the entry's own page is preferred to the ones next to it; a
+    povit, volost or territory given in the entry has to match, so an entry whose
+    candidates all lie in another district gets no match. The candidates left are
+    equally good, in the order of the settlements list. This is the filter chain of
+    the original matching; the scores are not used here, as a required feature that
+    does not match rejects a candidate however high it scores on the others.
+    """
+    candidates = scored
+    on_page = [c for c in candidates if c["features"]["page"]]
+    if len(candidates) > 1 and on_page:
+        candidates = on_page
+    for feature, _ in FEATURES[1:]:
+        if len(candidates) > 1 and fields[feature]:
+            candidates = [c for c in candidates if c["features"][feature]]
+    return candidates
+
+def report_entry(catalog_entry, status, scored, picked, index):
+    """Entry of the match report with every candidate ranked by its score."""
+    return {
+        "id": catalog_entry.get('id'),
+        "church_settlement": catalog_entry['church_settlement'],
+        "page": catalog_entry['page'],
+        "territory": catalog_entry['territory'],
+        "povit": catalog_entry.get('povit', ''),
+        "volost": catalog_entry.get('volost', catalog_entry.get('gmina', '')),
+        "status": status,
+        "candidates": [
+            {
+                "name": index.locations[c["position"]].get('name'),
+                "title": index.locations[c["position"]].get('title'),
+                "osm_id": index.locations[c["position"]].get('osm_id'),
+                "score": c["score"],
+                "features": c["features"],
+                "picked": c is picked,
+            }
+            for c in sorted(scored, key=lambda c: -c["score"])
+        ],
+    }
+
+def entry_candidates(catalog_entry, index):
+    """Positions of the settlements the catalog entry can be in."""
     name = catalog_entry['church_settlement']
     page = catalog_entry['page']
-    territory = normalize_territory(catalog_entry['territory'])
-    povit = catalog_entry.get('povit', '')
-    volost = catalog_entry.get('volost', catalog_entry.get('gmina', ''))
 
     # 1) первинний фільтр за назвою та сторінкою
-    candidates = locations_by_name(locations, name, page)
-    if not candidates:
+    ids = index.candidates(name, page)
+    if not ids:
         # Якщо name містить дужки, витягуємо слова перед і в дужках
         match = re.match(r'^(.*?)\s*\((.*?)\)$', name)
         if match:
             primary_name, secondary_name = match.groups()
-            candidates = locations_by_name(locations, primary_name, page)
+            ids = index.candidates(primary_name, page)
             # Якщо не знайшли за primary_name, пробуємо secondary_name
-            if not candidates:
-                candidates = locations_by_name(locations, secondary_name, page)
-
-    if len(candidates) > 1: 
-        # Якщо candidates містять правильну сторінку, фільтруємо за нею
-        page_candidates = [
-            loc for loc in candidates
-            if page in loc.get('pages', [])
-        ]
+            if not ids:
+                ids = index.candidates(secondary_name, page)
+    return ids
 
-        if page_candidates: 
-            candidates = page_candidates
+def rank_entry(catalog_entry, index, ids):
+    """
+    Pick the settlement of the catalog entry among the candidate positions. Returns
+    (position or None, warnings to log, report entry or None).
+    """
+    name = catalog_entry['church_settlement']
+    page = catalog_entry['page']
 
-    # 2) якщо ще більше одного — historic_district ⊇ povit
-    if len(candidates) > 1 and povit:
-        candidates = [
-            loc for loc in candidates
-            if povit.lower() in loc.get('historic_district', '').get('title', '').lower()
-        ]
-    # 3) якщо ще більше одного — historic_district ⊇ volost
-    if len(candidates) > 1 and volost:
-        def has_volost(loc):
-            hd = loc.get('historic_district', '').get('title', '').lower()
-            return (volost.lower() in hd) 
-        candidates = [loc for loc in candidates if has_volost(loc)]
-    # 4) якщо більше одного — фільтруємо historic_district ⊇ territory
-    if len(candidates) > 1:
-        candidates = [
-            loc for loc in candidates
-            if territory.lower() in loc.get('historic_district', '').get('title', '').lower()
-        ]
+    # 2) оцінюємо кандидатів за сторінкою, повітом, волостю та губернією
+    fields = entry_fields(catalog_entry)
+    scored = score_candidates(fields, ids, index)
+    candidates = select_candidates(scored, fields)
 
     if not candidates:
-        logger.warning(f"No match for {name} (page {page})")
-        return None
+        entry = report_entry(catalog_entry, "rejected", scored, None, index) if scored else None
+        return None, [f"No match for {name} (page {page})"], entry
+
+    warnings = []
+    entry = None
     if len(candidates) > 1:
-        logger.warning(f"Multiple matches for {name} (page {page}): picking first")
-    result = candidates[0]
+        entry = report_entry(catalog_entry, "ambiguous", scored, candidates[0], index)
+        warnings.append(f"Multiple matches for {name} (page {page}): picking first")
+    position = candidates[0]["position"]
 
-    if not result.get('location'):
-        logger.warning(f"No coordinates found for {name} (page {page})")
-        return None
+    if not index.locations[position].get('location'):
+        warnings.append(f"No coordinates found for {name} (page {page})")
+        return None, warnings, entry
 
-    return result
+    return position, warnings, entry
 
-def locations_by_name(locations, name, page):
-    candidates = [
-        loc for loc in locations
-        if loc.get('name') == name and any(p in loc.get('pages', []) for p in (page, page + 1, page - 1))
-    ]
+def match_entry(catalog_entry, locations, report=None, cache=None):
+    """
+    Find the settlement of the catalog entry. Candidates with the entry's settlement name
+    on its page or next to it are scored on FEATURES and narrowed down by
+    select_candidates; if several remain, the first one is taken. Ambiguous and rejected
+    matches are appended to the report list with the score breakdown of all candidates.
+    With a MatchCache, an entry whose fields and candidates are unchanged since the
+    cached run is not ranked again.
+    """
+    if not isinstance(locations, LocationsIndex):
+        locations = LocationsIndex(locations)
+    ids = entry_candidates(catalog_entry, locations)
 
-    # 1.1) якщо не знайшли, пробуємо old_district
-    if not candidates:
+    cached = cache.get(catalog_entry, locations, ids) if cache is not None else None
+    if cached is not None:
+        position, warnings, entry = cached
+    else:
+        position, warnings, entry = rank_entry(catalog_entry, locations, ids)
+        if cache is not None:
+            cache.put(catalog_entry, locations, ids, position, warnings, entry)
+
+    for warning in warnings:
+        logger.warning(warning)
+    if entry is not None and report is not None:
+        report.append(entry)
+    return locations.locations[position] if position is not None else None
+
+class MatchCache:
+    """
+    Matches of the catalog entries from earlier runs, keyed by entry id. An entry is
+    reused while the SHA-256 of the matching code (MATCH_CODE_VERSION), of the entry's
+    MATCH_FIELDS and of its candidate settlements (in order) is the same; the settlement is stored as its offset among
+    the candidates, so it does not depend on the rest of the settlements list.
+    """
+
+    def __init__(self, path=MATCH_CACHE_FILE):
+        self.path = path
+        self.entries = {}
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(path):
+            try:
+                self.entries = data_io.read_json(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable match cache {path}: {e}")
+
+    @staticmethod
+    def key(catalog_entry, index, ids):
+        fields = [catalog_entry.get(field) for field in MATCH_FIELDS]
         candidates = [
-            loc for loc in locations
-            if loc.get('old_district', {}).get('name') == name and any(p in loc.get('pages', []) for p in (page, page + 1, page - 1))
+            [index.districts[i], bool(index.locations[i].get('location'))]
+            + [index.locations[i].get(field) for field in CANDIDATE_FIELDS]
+            for i in ids
         ]
-        
-    return candidates
+        return hashlib.sha256(data_io.dumps([MATCH_CODE_VERSION, fields, candidates]).encode("utf-8")).hexdigest()
+
+    def get(self, catalog_entry, index, ids):
+        """Cached (position, warnings, report entry) of the entry, or None."""
+        entry_id = catalog_entry.get('id')
+        cached = self.entries.get(entry_id) if entry_id is not None else None
+        if cached is None or cached["key"] != self.key(catalog_entry, index, ids):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used[entry_id] = cached
+        offset = cached["offset"]
+        return (ids[offset] if offset is not None else None), cached["warnings"], cached["report"]
+
+    def put(self, catalog_entry, index, ids, position, warnings, entry):
+        entry_id = catalog_entry.get('id')
+        if entry_id is None:
+            return
+        self.used[entry_id] = {
+            "key": self.key(catalog_entry, index, ids),
+            "offset": ids.index(position) if position is not None else None,
+            "warnings": warnings,
+            "report": entry,
+        }
+
+    def save(self):
+        """Save the entries of this run; the ones of entries no longer in the catalog are dropped."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        data_io.write_json(self.path, self.used)
 
-def build_parafii_locations(catalog_path, locations_path, output_path):
-    with open(catalog_path, 'r', encoding='utf-8') as f:
-        catalog = json.load(f)
-    with open(locations_path, 'r', encoding='utf-8') as f:
-        locations = json.load(f)
+class LocationsIndex:
+    """
+    Settlements indexed by name, by old_district name and by catalog page. Entries are
+    positions in the settlements list, so lookups are set intersections that keep the
+    order of the list.
+    """
 
+    def __init__(self, locations):
+        self.locations = locations
+        self.by_name = {}
+        self.by_old_name = {}
+        self.by_page = {}
+        # Lowercase historic district titles the catalog fields are looked up in
+        self.districts = []
+        for i, loc in enumerate(locations):
+            district = loc.get('historic_district') or {}
+            title = district.get('title', '') if isinstance(district, dict) else district
+            self.districts.append(title.lower())
+            self.by_name.setdefault(loc.get('name'), set()).add(i)
+            self.by_old_name.setdefault(loc.get('old_district', {}).get('name'), set()).add(i)
+            for p in loc.get('pages', []):
+                self.by_page.setdefault(p, set()).add(i)
+
+    def find(self, by, name, page):
+        """Positions of the settlements with the name (in the by index) listed on the page or next to it."""
+        window = [self.by_page.get(p, ()) for p in (page, page + 1, page - 1)]
+        return sorted(i for i in by.get(name, ()) if any(i in pages for pages in window))
+
+    def candidates(self, name, page):
+        """Positions of the settlements named so near the page, by their old_district name if none is."""
+        ids = self.find(self.by_name, name, page)
+
+        # 1.1) якщо не знайшли, пробуємо old_district
+        if not ids:
+            ids = self.find(self.by_old_name, name, page)
+
+        return ids
+
+def locations_by_name(locations, name, page):
+    """Candidate settlements for the name near the page; locations is a LocationsIndex or the settlements list."""
+    index = locations if isinstance(locations, LocationsIndex) else LocationsIndex(locations)
+    return [index.locations[i] for i in index.candidates(name, page)]
+
+def locate_parafii(catalog, locations, report=None, cache=None):
+    """
+    Locate the parishes of the catalog. Ambiguous and rejected matches are appended to
+    the report list, if given. With a MatchCache only new and changed entries are ranked.
+    """
     parafii = []
+    index = LocationsIndex(locations)
 
     for entry in catalog:
-        loc = match_entry(entry, locations)
+        loc = match_entry(entry, index, report, cache)
         if loc is None:
             # Skip entries that do not match any location
             logger.warning(f"No matching location for {entry['church_settlement']}")
@@ -133,14 +328,36 @@ def build_parafii_locations(catalog_path, locations_path, output_path):
 
         parafii.append(info)
 
+    return parafii
+
+def build_parafii_locations(catalog_path, locations_path, output_path, report_path=None, cache_path=None):
+    catalog = data_io.read_json(catalog_path)
+    locations = data_io.read_json(locations_path)
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(parafii, f, ensure_ascii=False, indent=2)
+    report = []
+    cache = MatchCache(cache_path) if cache_path else None
+    parafii = locate_parafii(catalog, locations, report, cache)
+    if cache is not None:
+        cache.save()
+        logger.info(f"Reused {cache.hits} cached matches, matched {cache.misses} entries")
+
+    data_io.write_json(output_path, parafii)
     logger.info(f"Wrote {len(parafii)} records to {output_path}")
+    if report_path:
+        data_io.write_json(report_path, report, indent=2)
+        logger.info(f"Wrote {len(report)} ambiguous or rejected matches to {report_path}")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Match the catalog parishes with the settlement locations.")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse the matches of unchanged catalog entries from the previous --cache run "
+                             "(at the current catalog size matching everything is as fast)")
+    args = parser.parse_args()
+
     build_parafii_locations(
         catalog_path='data/catalog.json',
         locations_path='data/settlements_locations.json',
-        output_path='data/parafii_locations.json'
+        output_path='data/parafii_locations.json',
+        report_path='data/parafii_match_report.json',
+        cache_path=MATCH_CACHE_FILE if args.cache else None
     )
@@ -1,91 +1,184 @@
+import argparse
 import csv
-import json
+import data_io
+import sharding
 
-def find_record_by_code(records, code,field_name="koatuu"):
+# Columns of ua-name-places.csv the settlements use, the others are not loaded
+PLACE_COLUMNS = ("koatuu", "katotth", "name", "region", "rayon", "hromada", "osm_id")
+
+class PlacesIndex:
     """
-    Search for a record in CSV records whose field exactly matches the given code.
+    Place records keyed by their koatuu and by their katotth code. The first record of
+    a code wins, the same one a scan of the records would find.
     """
-    for rec in records:
-        rec_primary = rec.get(field_name, "")
-        if code == rec_primary:
-            return rec
-    return None
 
-def load_csv(filename):
+    def __init__(self, records):
+        self.records = records
+        self.by_field = {"koatuu": {}, "katotth": {}}
+        for rec in records:
+            for field_name, index in self.by_field.items():
+                index.setdefault(rec.get(field_name, ""), rec)
+
+    def find(self, code, field_name="koatuu"):
+        """Return the first record whose field exactly matches the given code."""
+        return self.by_field[field_name].get(code)
+
+def needed_codes(settlements):
+    """KOATUU and KATOTTH codes the settlements look up."""
+    koatuu_codes, katotth_codes = set(), set()
+    for settlement in settlements:
+        codes = settlement_codes(settlement)
+        if codes:
+            koatuu_codes.add(codes[0])
+            if codes[1]:
+                katotth_codes.add(codes[1])
+    return koatuu_codes, katotth_codes
+
+def load_csv(filename, settlements=None):
     """
-    Load CSV records into a list of dictionaries.
-    Assumes the CSV has headers: code, type, name.
-    Uses semicolon as the delimiter.
+    Stream the places CSV (comma separated) into a list of dictionaries with only the
+    PLACE_COLUMNS. With settlements, only the rows with a koatuu or katotth code one of
+    them looks up are kept.
     """
+    codes = needed_codes(settlements) if settlements is not None else None
     records = []
     with open(filename, newline='', encoding="utf-8-sig") as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=',')
+        reader = csv.reader(csvfile, delimiter=',')
+        header = next(reader, [])
+        columns = [(name, header.index(name)) for name in PLACE_COLUMNS if name in header]
+        koatuu_column = header.index("koatuu") if "koatuu" in header else None
+        katotth_column = header.index("katotth") if "katotth" in header else None
         for row in reader:
-            records.append(row)
+            if not row:
+                continue
+            if codes is not None:
+                koatuu = row[koatuu_column] if koatuu_column is not None and koatuu_column < len(row) else None
+                katotth = row[katotth_column] if katotth_column is not None and katotth_column < len(row) else None
+                if koatuu not in codes[0] and katotth not in codes[1]:
+                    continue
+            # Missing trailing values are None, as csv.DictReader fills them
+            records.append({name: row[i] if i < len(row) else None for name, i in columns})
     return records
 
-def update_settlements(settlements, csv_records):
+def settlement_codes(settlement):
+    """KOATUU code, KATOTTH code and type of a settlement to look up, None to skip it."""
+    old_district = settlement.get("old_district", {})
+    if not old_district:
+        return None
+
+    type = old_district.get("type", "")
+    koatuu = old_district.get("koatuu", "")
+    if not koatuu:
+        return None
+
+    katotth = None
+    new_district = settlement.get("new_district", {})
+    if new_district:
+        katotth = new_district.get("katotth", "")
+        type = new_district.get("type", type)
+    return koatuu, katotth, type
+
+def update_settlement(settlement, places):
+    """Update the settlement with its place record from the PlacesIndex; returns the message to print, if any."""
+    codes = settlement_codes(settlement)
+    if not codes:
+        return None
+    koatuu, katotth, type = codes
+
+    place_record = places.find(koatuu, "koatuu")
+    if not place_record and katotth:
+        # Try to find by katotth
+        place_record = places.find(katotth, "katotth")
+    if place_record:
+        settlement["new_district"] = {
+            "katotth": place_record.get("katotth", ""),
+            "name": place_record.get("name", ""),
+            "region": place_record.get("region", ""),
+            "rayon": place_record.get("rayon", ""),
+            "hromada": place_record.get("hromada", ""),
+            "type": type
+        }
+        settlement["osm_id"]= place_record.get("osm_id", "")
+        return None
+
+    title = settlement["old_district"].get("title", "")
+    return f"Settlement record not found for: {title} with koatuu: {koatuu}"
+
+def update_shard(settlements, csv_records):
+    """Worker of a sharded update_settlements(): returns the updated settlements with their messages."""
+    places = PlacesIndex(csv_records)
+    return [(settlement, update_settlement(settlement, places)) for settlement in settlements]
+
+def shard_settlements(settlements, csv_records):
     """
-    For each settlement record, update its old_district with the matching KOATUU code
-    and type. Caches oblast and rayon lookups to avoid repeated searches.
+    Split the settlements by the oblast digits of their KOATUU code and select for every
+    shard the records whose koatuu or katotth code one of its settlements looks up, in
+    file order, so the first match is the same as in the whole table.
+    Returns {oblast: (positions, records)}.
     """
-    
-    for settlement in settlements:
-        old_district = settlement.get("old_district", {})
-        if not old_district:
-            continue
-
-        # Extract raw fields
-        title = old_district.get("title", "")
-        type = old_district.get("type", "")
-        koatuu = old_district.get("koatuu", "")
-        if not koatuu:
-            continue
-
-        katotth = None
-        new_district = settlement.get("new_district", {})
-        if new_district:
-            katotth = new_district.get("katotth", "")
-            type = new_district.get("type", type)
-
-        place_record = find_record_by_code(csv_records, koatuu,"koatuu")
-        if not place_record and katotth:
-            # Try to find by katotth
-            place_record = find_record_by_code(csv_records, katotth,"katotth")
-        if place_record:
-            settlement["new_district"] = {
-                "katotth": place_record.get("katotth", ""),
-                "name": place_record.get("name", ""),
-                "region": place_record.get("region", ""),
-                "rayon": place_record.get("rayon", ""),
-                "hromada": place_record.get("hromada", ""),
-                "type": type
-            }
-            settlement["osm_id"]= place_record.get("osm_id", "")
-            
-        else:
-            print(f"Settlement record not found for: {title} with koatuu: {koatuu}")
+    codes = [settlement_codes(settlement) for settlement in settlements]
+    keys = [code[0][:2] if code else None for code in codes]
+    shards = {key: (positions, []) for key, positions in sharding.group_positions(keys).items()}
+
+    wanted = {}  # (field, code) -> shard keys
+    for key, code in zip(keys, codes):
+        if code:
+            wanted.setdefault(("koatuu", code[0]), set()).add(key)
+            if code[1]:
+                wanted.setdefault(("katotth", code[1]), set()).add(key)
+    for rec in csv_records:
+        targets = wanted.get(("koatuu", rec.get("koatuu", "")), set()) | wanted.get(("katotth", rec.get("katotth", "")), set())
+        for key in targets:
+            shards[key][1].append(rec)
+    return shards
+
+def update_settlements(settlements, csv_records, jobs=1):
+    """
+    For each settlement record, update its new_district and OSM id with the matching
+    place record, looked up by KOATUU code and then by KATOTTH code.
+    With jobs > 1 the settlements are sharded by oblast and updated in that many worker
+    processes, each getting only the place records its settlements need.
+    """
+    if jobs > 1:
+        shards = {
+            key: (positions, ([settlements[position] for position in positions], records))
+            for key, (positions, records) in shard_settlements(settlements, csv_records).items()
+        }
+        messages = []
+        for position, (settlement, message) in enumerate(sharding.run_shards(update_shard, shards, jobs)):
+            settlements[position] = settlement
+            messages.append(message)
+    else:
+        places = PlacesIndex(csv_records)
+        messages = [update_settlement(settlement, places) for settlement in settlements]
+
+    for message in messages:
+        if message:
+            print(message)
 
     return settlements
 
 def main():
+    parser = argparse.ArgumentParser(description="Add place details and OSM ids to the settlements.")
+    parser.add_argument("--jobs", "-j", type=int, default=1, metavar="N",
+                        help="update the settlements of different oblasts in N worker processes (default: 1)")
+    args = parser.parse_args()
+
     settlements_file = "data/settlements_locations.json"
     places_csv_file = "data/source/ua-name-places.csv"
     output_file = "data/settlements_locations.json"
 
     # Load settlements JSON data
-    with open(settlements_file, "r", encoding="utf-8") as f:
-        settlements = json.load(f)
+    settlements = data_io.read_json(settlements_file)
 
-    # Load Places CSV data
-    csv_records = load_csv(places_csv_file)
+    # Load the Places CSV rows the settlements need
+    csv_records = load_csv(places_csv_file, settlements)
 
     # Update settlements with matching details
-    updated_settlements = update_settlements(settlements, csv_records)
+    updated_settlements = update_settlements(settlements, csv_records, args.jobs)
 
     # Save updated settlements to a new JSON file
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(updated_settlements, f, ensure_ascii=False, indent=2)
+    data_io.write_json(output_file, updated_settlements)
 
     print(f"Updated settlements with details code saved to {output_file}")
 
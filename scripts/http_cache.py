@@ -0,0 +1,132 @@
+"""
+On-disk cache of downloaded pages.
+
+Page bodies are stored once under the SHA-256 of their content; every URL has a
+small record with the hash of its body, the ETag / Last-Modified validators and the
+time it was fetched. Cached pages younger than max_age are served without a request,
+older ones are revalidated with If-None-Match / If-Modified-Since, so an unchanged
+page costs a 304. In replay mode only the cache is used and nothing is downloaded,
+e.g. to rerun a crawl or a benchmark on recorded pages.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import requests
+
+import data_io
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HTTP_CACHE_DIR = os.path.join(ROOT_DIR, ".pipeline", "cache", "http")
+
+
+class CacheMiss(Exception):
+    """Raised in replay mode for a URL that is not in the cache."""
+
+
+class HttpCache:
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, max_age=None, replay=False):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.replay = replay
+        self.stats = {"cached": 0, "revalidated": 0, "downloaded": 0, "missing": 0}
+        self.lock = threading.Lock()
+
+    def _record_path(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "pages", digest[:2], digest + ".json")
+
+    def _body_path(self, digest):
+        return os.path.join(self.cache_dir, "bodies", digest[:2], digest)
+
+    def _count(self, outcome):
+        with self.lock:
+            self.stats[outcome] += 1
+
+    @staticmethod
+    def _write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, path)
+
+    def record(self, url):
+        """The cache record of the URL, or None."""
+        path = self._record_path(url)
+        if not os.path.exists(path):
+            return None
+        try:
+            record = data_io.read_json(path)
+        except (OSError, ValueError):
+            return None
+        return record if os.path.exists(self._body_path(record["body"])) else None
+
+    def body(self, record):
+        with open(self._body_path(record["body"]), "rb") as f:
+            return f.read()
+
+    def store(self, url, content, etag=None, last_modified=None):
+        digest = hashlib.sha256(content).hexdigest()
+        body_path = self._body_path(digest)
+        if not os.path.exists(body_path):
+            self._write(body_path, content)
+        record = {
+            "url": url,
+            "body": digest,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.time(),
+        }
+        self._write(self._record_path(url), data_io.dumps(record).encode("utf-8"))
+        return record
+
+    def fetch(self, url, get):
+        """
+        Body of the URL, from the cache or downloaded with get(url, headers), which
+        returns a requests-style response. Raises CacheMiss in replay mode for pages
+        that are not cached, requests.HTTPError for a 304 to a request without
+        validators, and whatever get or raise_for_status raise.
+        """
+        record = self.record(url)
+        cached = None
+        if record is not None:
+            try:
+                cached = self.body(record)
+            except OSError:
+                record = None
+        if self.replay:
+            if record is None:
+                self._count("missing")
+                raise CacheMiss(f"{url} is not in the cache")
+            self._count("cached")
+            return cached
+
+        if record is not None and self.max_age is not None and time.time() - record["fetched_at"] <= self.max_age:
+            self._count("cached")
+            return cached
+
+        # Only a page with its body in the cache is revalidated
+        headers = {}
+        if record is not None:
+            if record.get("etag"):
+                headers["If-None-Match"] = record["etag"]
+            if record.get("last_modified"):
+                headers["If-Modified-Since"] = record["last_modified"]
+
+        response = get(url, headers)
+        if response.status_code == 304:
+            if not headers:
+                raise requests.HTTPError(f"304 Not Modified for {url} without a cached copy", response=response)
+            # The server may send updated validators with the 304
+            self.store(url, cached, response.headers.get("ETag") or record.get("etag"),
+                       response.headers.get("Last-Modified") or record.get("last_modified"))
+            self._count("revalidated")
+            return cached
+        response.raise_for_status()
+        self.store(url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        self._count("downloaded")
+        return response.content
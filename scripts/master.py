@@ -1,34 +1,688 @@
 #!/usr/bin/env python3
+import argparse
+import cProfile
+import hashlib
+import logging
 import subprocess
 import sys, os
+import tempfile
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from copy import deepcopy
+
+import data_io
+import dataset_store
+import run_report
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BASE_DIR)
+
+# Fingerprints of the files every stage read and wrote during its last successful run
+PIPELINE_DIR = os.path.join(ROOT_DIR, ".pipeline")
+STATE_FILE = os.path.join(PIPELINE_DIR, "state.json")
+REPORT_FILE = os.path.join(PIPELINE_DIR, "run_report.json")
+PROFILES_DIR = os.path.join(PIPELINE_DIR, "profiles")
+
+CATALOG_PDF = "data/source/Каталог метричних книг, що зберігаються в Державному архіві Рівненської області.pdf"
+SETTLEMENTS_DOCX = "data/source/Географічний покажчик до населених пунктів до Каталогу метричних книг.docx"
+KOATUU_CSV = "data/source/Перехідна таблиця з КОАТУУ на Кодифікатор.csv"
+PLACES_CSV = "data/source/ua-name-places.csv"
+LOCATIONS_MAPPING_CSV = "data/locations_mapping.csv"
+
+CATALOG_JSON = "data/catalog.json"
+PARSED_SETTLEMENTS_JSON = "data/parsed_settlements.json"
+SETTLEMENTS_LOCATIONS_JSON = "data/settlements_locations.json"
+PARAFII_LOCATIONS_JSON = "data/parafii_locations.json"
+PARAFII_MATCH_REPORT_JSON = "data/parafii_match_report.json"
+PARAFII_GEOJSON = "data/parafii.geojson"
+DECERKVA_JSON = "data/decerkva.json"
+CERKVA_MATCHES_JSON = "data/cerkva_matches.json"
+CERKVA_MATCHES_CSV = "data/cerkva_matches.csv"
+
+# Indentation of the files people review, the intermediates are saved compact
+JSON_INDENT = {
+    PARAFII_GEOJSON: 2,
+    PARAFII_MATCH_REPORT_JSON: 2,
+    DECERKVA_JSON: 4,
+    CERKVA_MATCHES_JSON: 4,
+}
+
+class Datasets:
+    """
+    Datasets of an in-process run, keyed by their path relative to the repository root.
+    Files are loaded on first use and only written back by save(). With a DatasetStore
+    the datasets it keeps are read from and saved to the store, and their JSON files
+    are exported from it.
+    """
+
+    def __init__(self, store=None):
+        self.data = {}
+        self.dirty = set()
+        self.store = store
+        # Records of the datasets as they were loaded, for the run report
+        self.loaded_records = {}
+
+    def in_store(self, path):
+        return self.store is not None and path in dataset_store.DATASETS
+
+    @staticmethod
+    def path(path):
+        return os.path.join(ROOT_DIR, path)
+
+    def get(self, path, copy=False):
+        """Return the dataset; copy=True for stages that modify a dataset they do not produce."""
+        if path not in self.data and self.in_store(path) and self.store.source(path) == file_fingerprint(path):
+            # The store holds the same data as the file, unless the file was changed outside of it
+            self.data[path] = self.store.load(path)
+        if path not in self.data:
+            self.data[path] = data_io.read_json(self.path(path))
+        if path not in self.loaded_records:
+            self.loaded_records[path] = run_report.count_records(self.data[path])
+        return deepcopy(self.data[path]) if copy else self.data[path]
+
+    def put(self, path, data):
+        self.data[path] = data
+        self.dirty.add(path)
+
+    def save(self, path):
+        """Write the dataset to its file; returns the number of bytes written."""
+        if self.in_store(path):
+            self.store.save(path, self.data[path])
+            self.store.export(path, self.path(path), JSON_INDENT.get(path))
+            self.dirty.discard(path)
+            return os.path.getsize(self.path(path))
+        size = data_io.write_json(self.path(path), self.data[path], JSON_INDENT.get(path))
+        self.dirty.discard(path)
+        return size
+
+# In-process entry points of the stages: each one takes its inputs from the datasets
+# and puts its outputs back, without touching the disk for intermediate files.
+
+def catalog_stage(datasets):
+    import metric_catalog_parser
+    catalog = metric_catalog_parser.parse_pdf_catalog(datasets.path(CATALOG_PDF))
+    metric_catalog_parser.validate_catalog(catalog)
+    datasets.put(CATALOG_JSON, catalog)
+
+def settlements_stage(datasets):
+    import parse_settlements
+    datasets.put(PARSED_SETTLEMENTS_JSON, parse_settlements.parse_settlements_docx(datasets.path(SETTLEMENTS_DOCX)))
+
+def koatuu_stage(datasets):
+    import find_koatuu_code
+    settlements = datasets.get(PARSED_SETTLEMENTS_JSON, copy=True)
+    csv_records = find_koatuu_code.load_index(datasets.path(KOATUU_CSV))
+    datasets.put(SETTLEMENTS_LOCATIONS_JSON, find_koatuu_code.find_settlements_koatuu(settlements, csv_records))
 
-SCRIPTS = [
-    "metric_catalog_parser.py", #1
-    "parse_settlements.py", #2
-    "find_koatuu_code.py", #3
-    "other_country_settlements_geocoder.py", #4
-    "find_settlements_details.py", #5
-    "settlements_geocoder.py", #6
-    "find_parafii_locations.py", #7
-    "export_parafii_to_geojson.py", #8
+def other_countries_stage(datasets):
+    import other_country_settlements_geocoder
+    settlements = datasets.get(PARSED_SETTLEMENTS_JSON, copy=True)
+    locations = datasets.get(SETTLEMENTS_LOCATIONS_JSON)
+    datasets.put(SETTLEMENTS_LOCATIONS_JSON, other_country_settlements_geocoder.add_other_country_settlements(settlements, locations))
+
+def details_stage(datasets):
+    import find_settlements_details
+    settlements = datasets.get(SETTLEMENTS_LOCATIONS_JSON)
+    csv_records = find_settlements_details.load_csv(datasets.path(PLACES_CSV), settlements)
+    datasets.put(SETTLEMENTS_LOCATIONS_JSON, find_settlements_details.update_settlements(settlements, csv_records))
+
+def geocoder_stage(datasets):
+    import settlements_geocoder
+    settlements = datasets.get(SETTLEMENTS_LOCATIONS_JSON)
+    datasets.put(SETTLEMENTS_LOCATIONS_JSON, settlements_geocoder.update_settlements_locations(settlements))
+
+def parafii_stage(datasets):
+    import find_parafii_locations
+    catalog = datasets.get(CATALOG_JSON)
+    locations = datasets.get(SETTLEMENTS_LOCATIONS_JSON)
+    report = []
+    datasets.put(PARAFII_LOCATIONS_JSON, find_parafii_locations.locate_parafii(catalog, locations, report))
+    datasets.put(PARAFII_MATCH_REPORT_JSON, report)
+
+def geojson_stage(datasets):
+    import export_parafii_to_geojson
+    parafii = datasets.get(PARAFII_LOCATIONS_JSON, copy=True)
+    locations_mapping = export_parafii_to_geojson.load_locations_mapping(datasets.path(LOCATIONS_MAPPING_CSV))
+    datasets.put(PARAFII_GEOJSON, export_parafii_to_geojson.build_geojson(parafii, locations_mapping))
+
+def decerkva_stage(datasets):
+    import decerkva_parser
+    import http_cache
+    datasets.put(DECERKVA_JSON, decerkva_parser.parse_decerkva_data(logging.getLogger("decerkva_parser"),
+                                                                    cache=http_cache.HttpCache(),
+                                                                    journal=decerkva_parser.CrawlJournal()))
+
+def churches_stage(datasets):
+    import match_churches
+    logger = logging.getLogger("match_churches")
+    parafii = datasets.get(PARAFII_LOCATIONS_JSON)
+    decerkva_regions = datasets.get(DECERKVA_JSON)
+    matches = match_churches.match_parafii_churches(parafii, decerkva_regions, logger)
+    datasets.put(CERKVA_MATCHES_JSON, matches)
+    # The CSV is a final report, nothing reads it back
+    match_churches.save_matches_csv(matches, datasets.path(CERKVA_MATCHES_CSV), logger)
+
+# Pipeline stages in execution order. Paths are relative to the repository root,
+# "inputs" and "outputs" list every file the stage reads and writes.
+# Optional stages only run when they are passed to --include (or --force).
+STAGES = [
+    {
+        "name": "catalog",
+        "script": "metric_catalog_parser.py",
+        "function": catalog_stage,
+        "inputs": [CATALOG_PDF],
+        "outputs": [CATALOG_JSON],
+    },
+    {
+        "name": "settlements",
+        "script": "parse_settlements.py",
+        "function": settlements_stage,
+        "inputs": [SETTLEMENTS_DOCX],
+        "outputs": [PARSED_SETTLEMENTS_JSON],
+    },
+    {
+        "name": "koatuu",
+        "script": "find_koatuu_code.py",
+        "function": koatuu_stage,
+        "inputs": [PARSED_SETTLEMENTS_JSON, KOATUU_CSV],
+        "outputs": [SETTLEMENTS_LOCATIONS_JSON],
+    },
+    {
+        "name": "other_countries",
+        "script": "other_country_settlements_geocoder.py",
+        "function": other_countries_stage,
+        "inputs": [PARSED_SETTLEMENTS_JSON, SETTLEMENTS_LOCATIONS_JSON],
+        "outputs": [SETTLEMENTS_LOCATIONS_JSON],
+    },
+    {
+        "name": "details",
+        "script": "find_settlements_details.py",
+        "function": details_stage,
+        "inputs": [SETTLEMENTS_LOCATIONS_JSON, PLACES_CSV],
+        "outputs": [SETTLEMENTS_LOCATIONS_JSON],
+    },
+    {
+        "name": "geocoder",
+        "script": "settlements_geocoder.py",
+        "function": geocoder_stage,
+        "inputs": [SETTLEMENTS_LOCATIONS_JSON],
+        "outputs": [SETTLEMENTS_LOCATIONS_JSON],
+    },
+    {
+        "name": "parafii",
+        "script": "find_parafii_locations.py",
+        "function": parafii_stage,
+        "inputs": [CATALOG_JSON, SETTLEMENTS_LOCATIONS_JSON],
+        "outputs": [PARAFII_LOCATIONS_JSON, PARAFII_MATCH_REPORT_JSON],
+    },
+    {
+        "name": "geojson",
+        "script": "export_parafii_to_geojson.py",
+        "function": geojson_stage,
+        "inputs": [LOCATIONS_MAPPING_CSV, PARAFII_LOCATIONS_JSON],
+        "outputs": [PARAFII_GEOJSON],
+    },
+    {
+        "name": "decerkva",
+        "script": "decerkva_parser.py",
+        "function": decerkva_stage,
+        "inputs": [],
+        "outputs": [DECERKVA_JSON],
+        "optional": True,
+    },
+    {
+        "name": "churches",
+        "script": "match_churches.py",
+        "function": churches_stage,
+        "inputs": [PARAFII_LOCATIONS_JSON, DECERKVA_JSON],
+        "outputs": [CERKVA_MATCHES_JSON, CERKVA_MATCHES_CSV],
+        "optional": True,
+    },
 ]
 
-def run(script_name):
-    script_path = os.path.join(BASE_DIR, script_name)
+def file_fingerprint(path):
+    """Return the SHA-256 of the file content, or None if the file does not exist."""
+    full_path = os.path.join(ROOT_DIR, path)
+    if not os.path.exists(full_path):
+        return None
+    digest = hashlib.sha256()
+    with open(full_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def script_path(stage):
+    return os.path.join(BASE_DIR, stage["script"])
+
+def script_fingerprint(stage):
+    return file_fingerprint(os.path.relpath(script_path(stage), ROOT_DIR))
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {"stages": {}}
+    return data_io.read_json(STATE_FILE)
+
+def save_state(state):
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    data_io.write_json(STATE_FILE, state, indent=2)
+
+def find_stage(name):
+    for stage in STAGES:
+        if name in (stage["name"], stage["script"], os.path.splitext(stage["script"])[0]):
+            return stage
+    return None
+
+def file_writers(stages):
+    """Map every produced file to the names of the stages writing it, in execution order."""
+    writers = {}
+    for stage in stages:
+        for path in stage["outputs"]:
+            writers.setdefault(path, []).append(stage["name"])
+    return writers
+
+def plan_stages(stages, state, force):
+    """
+    Decide which stages have to run. Returns a dict: stage name -> reason.
+
+    A stage runs if it is forced, has never completed, its script or one of its
+    source inputs changed, or one of its outputs is missing. A file produced by the
+    pipeline that differs from its last recorded state re-runs the stage that first creates it.
+    Everything downstream of a re-run stage is re-run too, and a stage that updates a
+    file in place is only re-run together with the stage that creates that file.
+    """
+    writers = file_writers(stages)
+    records = state.get("stages", {})
+    reasons = {}
 
-    print(f"→ Running {script_name} …")
-    proc = subprocess.run([sys.executable, script_path], check=True)
-    print(f"✔ {script_name} completed.\n")
+    for stage in stages:
+        name = stage["name"]
+        record = records.get(name)
+        if name in force:
+            reasons[name] = "forced"
+        elif record is None:
+            reasons[name] = "no previous run"
+        elif record.get("script") != script_fingerprint(stage):
+            reasons[name] = f"{stage['script']} changed"
+        else:
+            for path in stage["inputs"]:
+                if path not in writers and file_fingerprint(path) != record["inputs"].get(path):
+                    reasons[name] = f"{path} changed"
+                    break
+            else:
+                for path in stage["outputs"]:
+                    if file_fingerprint(path) is None:
+                        reasons[name] = f"{path} is missing"
+                        break
+
+    for path, names in writers.items():
+        record = records.get(names[-1])
+        if record and file_fingerprint(path) != record["outputs"].get(path):
+            reasons.setdefault(names[0], f"{path} differs from its last recorded state")
+
+    changed = True
+    while changed:
+        changed = False
+        for i, stage in enumerate(stages):
+            if stage["name"] not in reasons:
+                continue
+            outputs = set(stage["outputs"])
+            for path in outputs & set(stage["inputs"]):
+                first_writer = writers[path][0]
+                if first_writer not in reasons:
+                    reasons[first_writer] = f"{stage['name']} updates {path} in place"
+                    changed = True
+            for later in stages[i + 1:]:
+                if later["name"] not in reasons and outputs & set(later["inputs"]):
+                    reasons[later["name"]] = f"depends on {stage['name']}"
+                    changed = True
+
+    return reasons
+
+def stage_dependencies(stages):
+    """
+    Build the dependency DAG of the stages: a stage depends on every earlier stage that
+    writes a file it reads or writes, or that reads a file it overwrites.
+    """
+    dependencies = {}
+    for i, stage in enumerate(stages):
+        reads, writes = set(stage["inputs"]), set(stage["outputs"])
+        dependencies[stage["name"]] = {
+            earlier["name"] for earlier in stages[:i]
+            if set(earlier["outputs"]) & (reads | writes) or set(earlier["inputs"]) & writes
+        }
+    return dependencies
+
+def record_stage(state, stage, input_fingerprints):
+    state.setdefault("stages", {})[stage["name"]] = {
+        "script": script_fingerprint(stage),
+        "inputs": input_fingerprints,
+        "outputs": {path: file_fingerprint(path) for path in stage["outputs"]},
+    }
+
+def profile_path(stage):
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    return os.path.join(PROFILES_DIR, f"{stage['name']}.prof")
+
+def run(stage, capture_output=False, profile=False):
+    """
+    Run the stage script in a subprocess and return its wall time, CPU time and peak RSS.
+    Stages running concurrently capture their output and print it in one piece when
+    they end, so the logs do not interleave. With profile the script runs under cProfile.
+    """
+    print(f"→ Running {stage['script']} …")
+    command = [sys.executable]
+    if profile:
+        command += ["-m", "cProfile", "-o", profile_path(stage)]
+    command.append(script_path(stage))
+
+    output = tempfile.TemporaryFile() if capture_output else None
+    started = time.perf_counter()
+    proc = subprocess.Popen(command, cwd=ROOT_DIR, stdout=output,
+                            stderr=subprocess.STDOUT if capture_output else None)
+    usage = None
+    if hasattr(os, "wait4"):
+        # wait4 gives the resource usage of this child alone, even with stages in parallel
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    else:
+        proc.wait()
+    wall_seconds = time.perf_counter() - started
+
+    if output:
+        output.seek(0)
+        print(f"── {stage['script']} output ──\n{output.read().decode('utf-8', errors='replace')}", end="")
+        output.close()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, command)
+    print(f"✔ {stage['script']} completed.\n")
+    return {
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": run_report.cpu_seconds(usage),
+        "peak_rss_kb": run_report.max_rss_kb(usage),
+    }
+
+def run_in_process(stage, datasets, profile=False):
+    """
+    Run the stage function and return its wall time, CPU time, the peak RSS of the
+    process so far (it includes the stages that ran before in the same process) and
+    the records of the input datasets, counted in memory.
+    """
+    print(f"→ Running {stage['script']} in-process …")
+    records_in = {
+        path: run_report.count_records(datasets.data[path]) if path in datasets.data else None
+        for path in stage["inputs"]
+    }
+    profiler = cProfile.Profile() if profile else None
+    started, cpu_started = time.perf_counter(), time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        stage["function"](datasets)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path(stage))
+    metrics = {
+        "wall_seconds": time.perf_counter() - started,
+        "cpu_seconds": time.process_time() - cpu_started,
+        "peak_rss_kb": run_report.max_rss_kb(run_report.self_usage()),
+        # Inputs the stage loaded itself were counted as they were loaded
+        "records_in": {path: datasets.loaded_records.get(path) if count is None else count
+                       for path, count in records_in.items()},
+    }
+    print(f"✔ {stage['script']} completed.\n")
+    return metrics
+
+def run_stage_worker(name, inputs, profile=False):
+    """
+    Run an in-process stage in a worker process of the pool. The datasets it reads are
+    passed in (the rest is loaded from disk); returns the datasets it produced and its metrics.
+    """
+    stage = find_stage(name)
+    datasets = Datasets()
+    datasets.data.update(inputs)
+    metrics = run_in_process(stage, datasets, profile)
+    return {path: datasets.data[path] for path in datasets.dirty}, metrics
+
+def execute_stages(stages, jobs, keep_going, submit, on_success):
+    """
+    Run the stages with at most `jobs` of them at a time; a stage starts as soon as all
+    the stages it depends on have finished. submit(stage) returns a Future, on_success
+    (stage, result) is called in this thread when the stage succeeds.
+
+    Failure policy: when a stage fails no new stages are started and the running ones
+    are allowed to finish. With keep_going the independent stages still run and only
+    the stages depending on the failed one are skipped. Returns the failed stages as a
+    list of (stage, exception).
+    """
+    names = {stage["name"] for stage in stages}
+    dependencies = {name: deps & names for name, deps in stage_dependencies(stages).items()}
+    pending = list(stages)
+    running = {}
+    finished, failed, blocked = set(), [], set()
+
+    while pending or running:
+        for stage in list(pending):
+            if len(running) >= jobs:
+                break
+            deps = dependencies[stage["name"]]
+            if deps & blocked:
+                print(f"• Skipping {stage['script']} (a stage it depends on failed).")
+                blocked.add(stage["name"])
+                pending.remove(stage)
+            elif deps <= finished:
+                running[submit(stage)] = stage
+                pending.remove(stage)
+
+        if not running:
+            break
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            stage = running.pop(future)
+            error = future.exception()
+            if error is None:
+                finished.add(stage["name"])
+                on_success(stage, future.result())
+                continue
+            failed.append((stage, error))
+            blocked.add(stage["name"])
+            if isinstance(error, subprocess.CalledProcessError):
+                print(f"✖ {stage['script']} failed (exit {error.returncode}).", file=sys.stderr)
+            else:
+                traceback.print_exception(type(error), error, error.__traceback__)
+                print(f"✖ {stage['script']} failed.", file=sys.stderr)
+            if not keep_going:
+                for skipped in pending:
+                    print(f"• Not starting {skipped['script']} after the failure.")
+                pending = []
+
+    return failed
+
+def save_in_process_results(state, datasets, completed, report, failed_outputs=()):
+    """
+    Write the datasets produced in memory and record the completed stages.
+    Outputs of a failed stage may be half-updated, so they are neither written nor recorded.
+    """
+    failed_outputs = set(failed_outputs)
+    for path in sorted(datasets.dirty - failed_outputs):
+        started = time.perf_counter()
+        size = datasets.save(path)
+        report.add_saved(path, time.perf_counter() - started, size)
+        print(f"  Saved {path}")
+    for stage, input_fingerprints in completed:
+        if failed_outputs & set(stage["outputs"]):
+            continue
+        record_stage(state, stage, input_fingerprints)
+    save_state(state)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the data processing pipeline, skipping up-to-date stages.")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE",
+                        help="re-run STAGE (name or script) even if its inputs are unchanged; 'all' re-runs everything")
+    parser.add_argument("--include", action="append", default=[], metavar="STAGE",
+                        help="also run the optional STAGE (decerkva, churches)")
+    parser.add_argument("--dry-run", action="store_true", help="only print which stages would run")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run the stages in this process and pass the datasets between them in memory")
+    parser.add_argument("--checkpoint", action="append", default=[], metavar="FILE",
+                        help="with --in-process, also write FILE as soon as a stage produces it "
+                             "(all outputs are written at the end of the run)")
+    parser.add_argument("--store", nargs="?", const=dataset_store.STORE_FILE, metavar="FILE",
+                        help="with --in-process, keep the intermediates in an SQLite store and export "
+                             f"the JSON files from it (default: {os.path.relpath(dataset_store.STORE_FILE, ROOT_DIR)})")
+    parser.add_argument("--jobs", "-j", type=int, default=1, metavar="N",
+                        help="run up to N independent stages at the same time (default: 1)")
+    parser.add_argument("--keep-going", "-k", action="store_true",
+                        help="after a failure keep running the stages that do not depend on the failed one")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"write a cProfile dump of every stage to {os.path.relpath(PROFILES_DIR, ROOT_DIR)}/STAGE.prof")
+    parser.add_argument("--count-records", action="store_true",
+                        help="without --in-process, parse the input and output files of every stage to count "
+                             "their records in the report (in-process runs count them in memory)")
+    parser.add_argument("--report", default=REPORT_FILE, metavar="FILE",
+                        help=f"where to save the performance report (default: {os.path.relpath(REPORT_FILE, ROOT_DIR)})")
+    return parser.parse_args()
+
+def select_stages(names):
+    selected = set()
+    for name in names:
+        stage = find_stage(name)
+        if not stage:
+            print(f"✖ Unknown stage: {name}", file=sys.stderr)
+            sys.exit(2)
+        selected.add(stage["name"])
+    return selected
 
 def main():
-    for s in SCRIPTS:
-        try:
-            run(s)
-        except subprocess.CalledProcessError as e:
-            print(f"✖ {s} failed (exit {e.returncode}). Aborting.", file=sys.stderr)
-            sys.exit(e.returncode)
+    args = parse_args()
+    if args.jobs < 1:
+        print("✖ --jobs must be at least 1", file=sys.stderr)
+        sys.exit(2)
+    if args.store and not args.in_process:
+        print("✖ --store requires --in-process", file=sys.stderr)
+        sys.exit(2)
+
+    force = select_stages(name for name in args.force if name != "all")
+    included = select_stages(args.include) | force
+    stages = [stage for stage in STAGES if not stage.get("optional") or stage["name"] in included]
+    if "all" in args.force:
+        force.update(stage["name"] for stage in stages)
+
+    state = load_state()
+    reasons = plan_stages(stages, state, force)
+    for stage in stages:
+        if stage["name"] not in reasons:
+            print(f"• Skipping {stage['script']} (up to date).")
+        elif args.dry_run:
+            print(f"→ Would run {stage['script']} ({reasons[stage['name']]}).")
+    if args.dry_run:
+        return
+
+    report = run_report.RunReport("in-process" if args.in_process else "subprocess", args.jobs)
+    for stage in stages:
+        if stage["name"] not in reasons:
+            report.add_stage(stage, "up_to_date")
+
+    stages = [stage for stage in stages if stage["name"] in reasons]
+    store = dataset_store.DatasetStore(args.store) if args.store else None
+    datasets = Datasets(store) if args.in_process else None
+    checkpoints = {os.path.normpath(path) for path in args.checkpoint}
+    completed = []
+    input_fingerprints = {}
+    input_metrics = {}
+
+    def before_stage(stage):
+        """
+        Fingerprint the inputs and measure what the stage is going to read. In-process
+        stages count their input records in memory; the input files of a subprocess
+        stage are only parsed to count them with --count-records.
+        """
+        input_fingerprints[stage["name"]] = {path: file_fingerprint(path) for path in stage["inputs"]}
+        bytes_read = 0
+        for path in stage["inputs"]:
+            if datasets is None or path not in datasets.data:
+                bytes_read += run_report.file_size(Datasets.path(path))
+        metrics = {"bytes_read": bytes_read}
+        if datasets is None and args.count_records:
+            metrics["records_in"] = {path: run_report.file_records(Datasets.path(path)) for path in stage["inputs"]}
+        input_metrics[stage["name"]] = metrics
+
+    if datasets is None:
+        pool = ThreadPoolExecutor(args.jobs)
+        def submit(stage):
+            before_stage(stage)
+            return pool.submit(run, stage, args.jobs > 1, args.profile)
+    elif args.jobs == 1:
+        # A single worker thread shares the datasets with this thread
+        pool = ThreadPoolExecutor(1)
+        def submit(stage):
+            before_stage(stage)
+            return pool.submit(run_in_process, stage, datasets, args.profile)
+    else:
+        pool = ProcessPoolExecutor(args.jobs)
+        def submit(stage):
+            before_stage(stage)
+            inputs = {path: datasets.data[path] for path in stage["inputs"] if path in datasets.data}
+            return pool.submit(run_stage_worker, stage["name"], inputs, args.profile)
+
+    def on_success(stage, result):
+        metrics = dict(input_metrics[stage["name"]])
+        if datasets is None:
+            metrics.update(result)
+            if args.count_records:
+                metrics["records_out"] = {path: run_report.file_records(Datasets.path(path)) for path in stage["outputs"]}
+            metrics["bytes_written"] = sum(run_report.file_size(Datasets.path(path)) for path in stage["outputs"])
+            record_stage(state, stage, input_fingerprints[stage["name"]])
+            save_state(state)
+        else:
+            if args.jobs > 1:
+                outputs, result = result
+                for path, data in outputs.items():
+                    datasets.put(path, data)
+            metrics.update(result)
+            metrics["records_out"] = {
+                path: run_report.count_records(datasets.data[path]) if path in datasets.data else None
+                for path in stage["outputs"]
+            }
+            metrics["bytes_written"] = 0
+            for path in stage["outputs"]:
+                if path in checkpoints and path in datasets.dirty:
+                    metrics["bytes_written"] += datasets.save(path)
+                    print(f"  Checkpoint saved to {path}")
+            completed.append((stage, input_fingerprints[stage["name"]]))
+        for key in ("wall_seconds", "cpu_seconds"):
+            if metrics.get(key) is not None:
+                metrics[key] = round(metrics[key], 3)
+        if args.profile:
+            metrics["profile"] = os.path.relpath(profile_path(stage), ROOT_DIR)
+        report.add_stage(stage, "ok", **metrics)
+
+    with pool:
+        failed = execute_stages(stages, args.jobs, args.keep_going, submit, on_success)
+
+    if datasets is not None:
+        failed_outputs = {path for stage, _ in failed for path in stage["outputs"]}
+        save_in_process_results(state, datasets, completed, report, failed_outputs)
+    if store is not None:
+        store.close()
+
+    reported = {entry["name"] for entry in report.data["stages"]}
+    for stage, error in failed:
+        report.add_stage(stage, "failed", error=str(error))
+        reported.add(stage["name"])
+    for stage in stages:
+        if stage["name"] not in reported:
+            report.add_stage(stage, "not_run")
+    report.save(os.path.abspath(args.report))
+    print(f"  Performance report saved to {args.report}")
+
+    if failed:
+        names = ", ".join(stage["script"] for stage, _ in failed)
+        print(f"✖ Pipeline failed: {names}.", file=sys.stderr)
+        error = failed[0][1]
+        sys.exit(error.returncode if isinstance(error, subprocess.CalledProcessError) else 1)
+
     print("🎉 All scripts finished successfully!")
 
 if __name__ == "__main__":
@@ -6,25 +6,34 @@ Matching rules
 --------------
 1. **Region / Oblast** must match *ignoring the word “область”*.
 2. **District / Raion** must match *ignoring the word “район”*.
-3. **Settlement** names may differ slightly (fuzzy match; ≥ 0.85
-   `difflib.SequenceMatcher` ratio).
-4. **Church** names are compared after:
+3. **Settlement** names match when the decerkva name contains the parish
+   settlement name. With `--fuzzy` they may also differ slightly (fuzzy match;
+   ≥ 0.85 `difflib.SequenceMatcher` ratio by default).
+4. With `--church-keywords`, **church** names are compared after:
      * removing the word “церква” (and its abbreviations “ц.”),
      * lower-casing,
      * stripping punctuation,
      * dropping very common stop-words (e.g. “пресвятої”, “богородиці” …).
    A match is accepted if the sets of key words share **at least one
-   common word of length ≥ 4**.
+   common word of length ≥ 4** (or as many as given).
+
+Churches (“церква”) never match a костел or a Jewish community.
+
+With `--radius KM` every match also gets its distance from the parafia and is
+confirmed when the church is within KM; for the parafii without a confirmed
+match the churches within KM are saved to `cerkva_nearby.json` for review.
 
 The script prints the result list as JSON (and can optionally save it
 to `matches.json`).
 """
 
-import json
+import argparse
+import data_io
+import math
 import re
 from difflib import SequenceMatcher
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
 
 # --------------------------------------------------------------------------- #
@@ -38,17 +47,24 @@ _STOP_WORDS = {
 }
 
 _RX_PUNCT = re.compile(r"[^\w\s]", flags=re.U)
+_RX_SPACES = re.compile(r"\s+")
+_RX_CHURCH = re.compile(r"\bцеркв[аюи]?\b", flags=re.I)
+# Compiled suffix patterns of _strip_suffix, by suffix
+_RX_SUFFIX: Dict[str, "re.Pattern"] = {}
 
 
 def _strip_suffix(text: str, suffix: str) -> str:
     """Remove suffix (e.g. 'область', 'район') and trim."""
-    return re.sub(fr"\s*{suffix}\s*$", "", text.strip(), flags=re.I)
+    rx = _RX_SUFFIX.get(suffix)
+    if rx is None:
+        rx = _RX_SUFFIX[suffix] = re.compile(fr"\s*{suffix}\s*$", flags=re.I)
+    return rx.sub("", text.strip())
 
 
 def _normalize(txt: str) -> str:
     """Lower-case, remove punctuation, collapse spaces."""
     txt = _RX_PUNCT.sub(" ", txt.lower())
-    return re.sub(r"\s+", " ", txt).strip()
+    return _RX_SPACES.sub(" ", txt).strip()
 
 
 def _settlement_sim(a: str, b: str) -> float:
@@ -58,7 +74,7 @@ def _settlement_sim(a: str, b: str) -> float:
 
 def _church_keywords(name: str) -> List[str]:
     """Return significant words (≥4 chars, not stop-words, no 'церква')."""
-    name = re.sub(r"\bцеркв[аюи]?\b", " ", name, flags=re.I)
+    name = _RX_CHURCH.sub(" ", name)
     words = [_normalize(w) for w in name.split()]
     return [w for w in words if len(w) >= 4 and w not in _STOP_WORDS]
 
@@ -68,82 +84,195 @@ def _church_match(words_a: List[str], words_b: List[str]) -> bool:
     return bool(set(words_a) & set(words_b))
 
 
-# --------------------------------------------------------------------------- #
-# Load data                                                                   #
-# --------------------------------------------------------------------------- #
-
-
-
+# Defaults of --fuzzy and --church-keywords
+SETTLEMENT_THRESHOLD = 0.85
+CHURCH_KEYWORDS = 1
+
+
+def _similar_settlements(name: str, records: List[Dict], threshold: float) -> Dict[int, float]:
+    """
+    `_settlement_sim` of the normalized name and the records' settlement names, for
+    the records (by position) reaching the threshold. Every record has its own
+    matcher with its name as seq2, which SequenceMatcher analyses once for all the
+    parishes of the district (the name stays seq1, as the ratio is not symmetric),
+    and the cheap upper bounds of the ratio rule most records out before the full
+    ratio is computed.
+    """
+    scores = {}
+    for i, record in enumerate(records):
+        matcher = record["matcher"]
+        matcher.set_seq1(name)
+        if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+            continue
+        ratio = matcher.ratio()
+        if ratio >= threshold:
+            scores[i] = ratio
+    return scores
 
-# Flatten decerkva → one record per settlement
-# decerkva_flat: List[Dict] = []
-# for reg in decerkva_regions:
-#     region_clean = _strip_suffix(reg["region"], "область")
-#     for dist in reg["districts"]:
-#         district_clean = _strip_suffix(dist["district"], "район")
-#         for stl in dist["settlements"]:
-#             decerkva_flat.append({
-#                 "region": region_clean,
-#                 "district": district_clean,
-#                 "settlement": stl["name"],
-#                 "church": stl["church_name"],
-#                 "location": stl["location"],
-#             })
 
 # --------------------------------------------------------------------------- #
 # Matching                                                                    #
 # --------------------------------------------------------------------------- #
 
-#matches: List[Dict] = []
-
-# for p in parafii:
-#     # 1. region / district must match exactly (sans suffixes)
-#     p_region = _strip_suffix(p["old_district"]["oblast"], "область")
-#     p_district = _strip_suffix(p["old_district"]["rayon"], "район")
-#     p_settlement = p["old_district"]["name"]
-
-#     # Candidate decerkva entries in the same oblast & raion
-#     cand: List[Tuple[Dict, float]] = []
-#     for d in decerkva_flat:
-#         if d["region"] != p_region or d["district"] != p_district:
-#             continue
-#         sim = _settlement_sim(p_settlement, d["settlement"])
-#         if sim >= 0.85:
-#             cand.append((d, sim))
-
-#     if not cand:
-#         continue  # no settlement candidate ⇒ no match
-
-#     # For each candidate, check church name keywords overlap
-#     p_words = _church_keywords(p["church"])
-#     for d, _ in cand:
-#         d_words = _church_keywords(d["church"])
-#         if _church_match(p_words, d_words):
-#             matches.append({
-#                 "parafia": p["church"],
-#                 "parafia_settlement": f"{p['old_district']['oblast']} область, "
-#                                       f"{p['old_district']['rayon']} район, "
-#                                       f"{p_settlement}",
-#                 "decerkva_settlement": f"{d['region']} {d['district']} {d['settlement']}",
-#                 "decerkva": d["church"],
-#                 "location": d["location"],
-#             })
-#             break  # assume at most one match per parafia
-
-def find_matches(parafii_file, decerkva_file, logger):
-    matches = {}
+def find_matches(parafii_file, decerkva_file, logger,
+                 settlement_threshold: Optional[float] = None, church_keywords: int = 0,
+                 radius_km: Optional[float] = None, nearby: Optional[Dict] = None):
     # Load settlements JSON data
-    with open(parafii_file, "r", encoding="utf-8") as f:
-        parafii = json.load(f)
+    parafii = data_io.read_json(parafii_file)
 
     # Load decerkva JSON data
-    with open(decerkva_file, "r", encoding="utf-8") as f:
-        decerkva_regions = json.load(f)
+    decerkva_regions = data_io.read_json(decerkva_file)
+
+    return match_parafii_churches(parafii, decerkva_regions, logger, settlement_threshold, church_keywords,
+                                  radius_km, nearby)
+
+
+class DecerkvaIndex:
+    """
+    decerkva settlements grouped by their (region, district) names without the
+    “область” / “район” suffixes, in file order, with the names every parish is
+    compared against computed once per settlement. records has every settlement,
+    including the ones of city councils.
+    """
+
+    def __init__(self, decerkva_regions):
+        self.districts: Dict[Tuple[str, str], List[Dict]] = {}
+        self.records: List[Dict] = []
+        # Districts whose records have the fuzzy matching fields
+        self.normalized = set()
+        for region in decerkva_regions:
+            region_name = _strip_suffix(region["region"], "область")
+            for district in region["districts"]:
+                if "district" in district:
+                    district_name = _strip_suffix(district["district"], "район")
+                    records = self.districts.setdefault((region_name, district_name), [])
+                else:
+                    # City councils are saved under their own name instead of a district
+                    # one; no parish refers to them, only the nearby churches include them
+                    district_name = next((key for key in district if key != "settlements"), "")
+                    records = None
+                for settlement in district["settlements"]:
+                    settlement_name = _strip_suffix(settlement["name"], "село")
+                    record = {
+                        "region": region_name,
+                        "district": district_name,
+                        "council": records is None,
+                        "settlement": settlement_name,
+                        "settlement_lower": settlement_name.lower(),
+                        "church": settlement["church_name"],
+                        "is_church": "церква" in settlement["church_name"].lower(),
+                        "location": settlement.get("location"),
+                    }
+                    self.records.append(record)
+                    if records is not None:
+                        records.append(record)
+
+    def settlements(self, region: str, district: str, normalized: bool = False) -> List[Dict]:
+        """
+        Settlements of the district. With normalized, the records also have the
+        normalized settlement name, a SequenceMatcher with it as seq2 and the church
+        keywords, computed on first use.
+        """
+        key = (region, district)
+        records = self.districts.get(key, [])
+        if normalized and key not in self.normalized:
+            for record in records:
+                record["settlement_norm"] = _normalize(record["settlement"])
+                record["matcher"] = SequenceMatcher(None, "", record["settlement_norm"])
+                record["keywords"] = frozenset(_church_keywords(record["church"]))
+            self.normalized.add(key)
+        return records
+
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def _distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle (haversine) distance between two points."""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class ChurchGrid:
+    """
+    Grid over the decerkva records with a location ([lat, lon]), with cells of about
+    cell_km on each side, for radius queries that only look at the cells around the
+    point instead of every church.
+    """
+
+    def __init__(self, records: List[Dict], cell_km: float):
+        if cell_km <= 0:
+            raise ValueError(f"cell size must be greater than 0, got {cell_km}")
+        located = [r for r in records if r["location"]]
+        # Longitude degrees shrink towards the poles; size the cells at the mean latitude
+        mean_lat = sum(r["location"][0] for r in located) / len(located) if located else 0.0
+        self.cell_lat = cell_km / KM_PER_DEGREE
+        self.cell_lon = cell_km / (KM_PER_DEGREE * max(math.cos(math.radians(mean_lat)), 0.01))
+        self.cells: Dict[Tuple[int, int], List[Dict]] = {}
+        for record in located:
+            lat, lon = record["location"]
+            self.cells.setdefault(self._cell(lat, lon), []).append(record)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_lat), math.floor(lon / self.cell_lon)
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, Dict]]:
+        """(distance in km, record) of the churches within the radius, nearest first."""
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        lat_low, lon_low = self._cell(lat - dlat, lon - dlon)
+        lat_high, lon_high = self._cell(lat + dlat, lon + dlon)
+        found = []
+        for cell_lat in range(lat_low, lat_high + 1):
+            for cell_lon in range(lon_low, lon_high + 1):
+                for record in self.cells.get((cell_lat, cell_lon), ()):
+                    distance = _distance_km(lat, lon, *record["location"])
+                    if distance <= radius_km:
+                        found.append((distance, record))
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+def _decerkva_settlement(record: Dict) -> str:
+    district = record["district"] if record["council"] else f"{record['district']} район"
+    return f"{record['region']} область {district} {record['settlement']}"
+
+
+def match_parafii_churches(parafii, decerkva_regions, logger,
+                           settlement_threshold: Optional[float] = None, church_keywords: int = 0,
+                           radius_km: Optional[float] = None, nearby: Optional[Dict] = None):
+    """
+    Match every parafia with the decerkva churches of its settlement. With
+    settlement_threshold, settlements with a similar name match too; with
+    church_keywords, the church names have to share that many keywords.
+
+    With radius_km, every match gets the distance between the parafia and the church
+    and is confirmed if it is within the radius. The churches within the radius of a
+    parafia without a confirmed match are added to the nearby dict (by parafia id) as
+    candidates to review. A radius_km that is not positive raises ValueError.
+    """
+    if radius_km is not None and radius_km <= 0:
+        raise ValueError(f"radius_km must be greater than 0, got {radius_km}")
+    matches = {}
 
-    # Flatten decerkva → one record per settlement
+    index = DecerkvaIndex(decerkva_regions)
+    grid = None
+    if radius_km is not None:
+        grid = ChurchGrid(index.records, radius_km)
 
     for parafia in parafii:
-       
+        # parafii_locations.json keeps [lon, lat]
+        parafia_location = parafia.get("location")
+        parafia_latlon = (parafia_location[1], parafia_location[0]) if parafia_location else None
+        # Churches never match a костел or a synagogue
+        skip_churches = "костел" in parafia["church"].lower() or parafia["religion"] == "judaism"
+
+        if grid is not None and parafia_latlon and nearby is not None:
+            propose_nearby(parafia, grid.within(*parafia_latlon, radius_km), skip_churches, nearby)
 
         parafia_oblast = _strip_suffix(parafia.get("old_district", {}).get("oblast", ""), "область")
         parafia_rayon = _strip_suffix( parafia.get("old_district", {}).get("rayon", ""), "район")
@@ -151,71 +280,74 @@ def find_matches(parafii_file, decerkva_file, logger):
         if( not parafia_oblast or not parafia_rayon):
             logger.warning(f"Skipping parafia {parafia['church']} due to missing oblast or rayon.")
             continue
-        # Find matching region and district in decerkva
 
-        for region in decerkva_regions:
-            region_name = _strip_suffix(region["region"], "область")
-            if region_name != parafia_oblast:
+        parafia_name = parafia["old_district"]["name"].lower()
+        parafia_keywords = set(_church_keywords(parafia["church"])) if church_keywords else None
+
+        # Only the settlements of the parafia's own region and district
+        records = index.settlements(parafia_oblast, parafia_rayon,
+                                    normalized=settlement_threshold is not None or church_keywords > 0)
+        similar = {}
+        if settlement_threshold is not None and records:
+            similar = _similar_settlements(_normalize(parafia_name), records, settlement_threshold)
+        for i, record in enumerate(records):
+            similarity = similar.get(i)
+            if similarity is None and parafia_name not in record["settlement_lower"]:
                 continue
-            for district in region["districts"]:
-                district_name = _strip_suffix(district["district"], "район")
-                if( district_name != parafia_rayon):
-                    continue
-                # Now we are in the right region and district
-                for settlement in district["settlements"]:
-                    settlement_name = _strip_suffix(settlement["name"], "село")
-                    if parafia["old_district"]["name"].lower() in settlement_name.lower():
-                        # Found matching settlement
-
-                        # Check church name
-                        if "церква" in settlement["church_name"].lower():
-                            if "костел" in parafia["church"].lower():
-                                continue
-                            if parafia["religion"] == "judaism":
-                                continue
-
-
-                        # check if matches contains parafia by parafia id
-                        if parafia["id"] not in matches:
-                            matches[parafia["id"]] = []
-                        
-                        match = { 
-                            "parafia": parafia["church"],
-                            "parafia_settlement": f"{parafia_oblast} область "
-                                                  f"{parafia_rayon} район "
-                                                  f"{parafia['old_district']['name']}",
-                            "decerkva_settlement": f"{region_name} область {district_name} район {settlement_name}",
-                            "decerkva": settlement["church_name"],
-                            "location": settlement["location"]
-                        }
-                        matches[parafia["id"]].append(match)
-                        logger.info(f"Match found: {parafia['church']} in {parafia_oblast} {parafia_rayon} "
-                                    f"matches {settlement_name} in {region_name} {district_name}")
-                        # Assuming we want only one match per parafia
-                        # If you want all matches, remove the break 
-                        #break
+            if record["is_church"] and skip_churches:
+                continue
+            if church_keywords and len(parafia_keywords & record["keywords"]) < church_keywords:
+                continue
+
+            match = {
+                "parafia": parafia["church"],
+                "parafia_settlement": f"{parafia_oblast} область "
+                                      f"{parafia_rayon} район "
+                                      f"{parafia['old_district']['name']}",
+                "decerkva_settlement": _decerkva_settlement(record),
+                "decerkva": record["church"],
+                "location": record["location"]
+            }
+            if similarity is not None:
+                match["settlement_similarity"] = round(similarity, 3)
+            if grid is not None and parafia_latlon and record["location"]:
+                distance = _distance_km(*parafia_latlon, *record["location"])
+                match["distance_km"] = round(distance, 2)
+                match["confirmed"] = distance <= radius_km
+                if match["confirmed"] and nearby is not None:
+                    # A confirmed match needs no candidates
+                    nearby.pop(parafia["id"], None)
+            matches.setdefault(parafia["id"], []).append(match)
+            logger.info(f"Match found: {parafia['church']} in {parafia_oblast} {parafia_rayon} "
+                        f"matches {record['settlement']} in {record['region']} {record['district']}")
     logger.info(f"Found {len(matches)} matches.")
+    if nearby is not None and grid is not None:
+        logger.info(f"Found nearby churches for {len(nearby)} parafii without a confirmed match.")
     return matches
 
 
-
-def main():
-    parafii_file = "data/parafii_locations.json"
-    decerkva_file = "data/decerkva.json"
-    output_file = "data/cerkva_matches.json"
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-    logger = logging.getLogger(__name__)
-    logger.info("Starting decerkva data matching...")
-    
-    matches = find_matches(parafii_file,decerkva_file,logger)
-
-    # Save matches to JSON file
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(matches, f, ensure_ascii=False, indent=4)
-    print(f"Mathed data saved to {output_file}")
-
-    # Save matches to CSV file
-    csv_output_file = "data/cerkva_matches.csv"
+def propose_nearby(parafia, near: List[Tuple[float, Dict]], skip_churches: bool, nearby: Dict):
+    """Add the churches near the parafia (from ChurchGrid.within) to nearby as its candidates."""
+    candidates = [
+        {
+            "decerkva_settlement": _decerkva_settlement(record),
+            "decerkva": record["church"],
+            "location": record["location"],
+            "distance_km": round(distance, 2),
+        }
+        for distance, record in near
+        if not (record["is_church"] and skip_churches)
+    ]
+    if candidates:
+        nearby[parafia["id"]] = {
+            "parafia": parafia["church"],
+            "church_settlement": parafia.get("church_settlement", ""),
+            "candidates": candidates,
+        }
+
+
+
+def save_matches_csv(matches, csv_output_file, logger):
     with open(csv_output_file, "w", encoding="utf-8") as f:
         f.write("id,parafia,parafia_settlemen,decerkva_settlement,decerkva,lat,lon\n")
         for parafia_id, match_list in matches.items():
@@ -231,5 +363,43 @@ def main():
                         f"{match['location'][0]},"
                         f"{match['location'][1]}\n")
 
+def main():
+    parser = argparse.ArgumentParser(description="Match the parishes with the churches of decerkva.")
+    parser.add_argument("--fuzzy", type=float, nargs="?", const=SETTLEMENT_THRESHOLD, metavar="THRESHOLD",
+                        help="also match settlements with a similar name "
+                             f"(SequenceMatcher ratio, default {SETTLEMENT_THRESHOLD})")
+    parser.add_argument("--church-keywords", type=int, nargs="?", const=CHURCH_KEYWORDS, default=0, metavar="N",
+                        help=f"require the church names to share N keywords (default {CHURCH_KEYWORDS})")
+    parser.add_argument("--radius", type=float, metavar="KM",
+                        help="confirm the matches within KM of the parafia and propose the churches "
+                             "within KM of the parafii without a confirmed match")
+    parser.add_argument("--nearby-output", default="data/cerkva_nearby.json", metavar="FILE",
+                        help="where to save the proposed nearby churches (default: %(default)s)")
+    args = parser.parse_args()
+    if args.radius is not None and args.radius <= 0:
+        parser.error("--radius must be greater than 0")
+
+    parafii_file = "data/parafii_locations.json"
+    decerkva_file = "data/decerkva.json"
+    output_file = "data/cerkva_matches.json"
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger = logging.getLogger(__name__)
+    logger.info("Starting decerkva data matching...")
+    
+    nearby = {}
+    matches = find_matches(parafii_file, decerkva_file, logger, args.fuzzy, args.church_keywords,
+                           args.radius, nearby)
+
+    # Save matches to JSON file
+    data_io.write_json(output_file, matches, indent=4)
+    print(f"Mathed data saved to {output_file}")
+
+    if args.radius is not None:
+        data_io.write_json(args.nearby_output, nearby, indent=4)
+        print(f"Nearby churches saved to {args.nearby_output}")
+
+    # Save matches to CSV file
+    save_matches_csv(matches, "data/cerkva_matches.csv", logger)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
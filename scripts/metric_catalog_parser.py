@@ -1,5 +1,5 @@
 import re
-import json
+import data_io
 import logging
 import warnings
 import pdfplumber
@@ -296,12 +296,7 @@ def parse_pdf_catalog(pdf_path: str) -> list:
 
     return entries
 
-if __name__ == "__main__":
-    input_pdf  = "data/source/Каталог метричних книг, що зберігаються в Державному архіві Рівненської області.pdf"
-    output_json = "data/catalog.json"
-
-    catalog = parse_pdf_catalog(input_pdf)
-    # Validate the catalog
+def validate_catalog(catalog: list) -> None:
     # Check if id is unique
     ids = set()
     for entry in catalog:
@@ -313,11 +308,20 @@ if __name__ == "__main__":
         else:
             print(f"Missing id in entry: {entry}")
 
-    
     print(f"Number of entries in the catalog: {len(catalog)}")
 
+
+def main():
+    input_pdf  = "data/source/Каталог метричних книг, що зберігаються в Державному архіві Рівненської області.pdf"
+    output_json = "data/catalog.json"
+
+    catalog = parse_pdf_catalog(input_pdf)
+    validate_catalog(catalog)
+
     # Save the catalog to a JSON file
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(catalog, f, ensure_ascii=False, indent=2)
+    data_io.write_json(output_json, catalog)
 
     print(f"Saved {len(catalog)} entries to {output_json}")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import json
+import data_io
 import time
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut
@@ -99,18 +99,8 @@ def lookup_othercountry_settlement(title, settlement, country):
     #settlement["old_district"]["koatuu"] = "other_country"
     return settlement
 
-def main():
-    settlements_file = "data/parsed_settlements.json"
-    locations_file = "data/settlements_locations.json"
-
-    # Load settlements JSON data
-    with open(settlements_file, "r", encoding="utf-8") as f:
-        settlements = json.load(f)
-
-    # Load settlements locations JSON data
-    with open(locations_file, "r", encoding="utf-8") as f:
-        locations = json.load(f)
-
+def add_other_country_settlements(settlements, locations):
+    """Geocode settlements located outside of Ukraine and append them to locations."""
     for settlement in settlements:
         old_district = settlement.get("old_district", {})
         if not old_district:
@@ -131,9 +121,22 @@ def main():
                 print(f"Country is not Ukraine for: {title} with country {country}")
             continue
 
+    return locations
+
+def main():
+    settlements_file = "data/parsed_settlements.json"
+    locations_file = "data/settlements_locations.json"
+
+    # Load settlements JSON data
+    settlements = data_io.read_json(settlements_file)
+
+    # Load settlements locations JSON data
+    locations = data_io.read_json(locations_file)
+
+    locations = add_other_country_settlements(settlements, locations)
+
     # Save updated settlements to a new JSON file
-    with open(locations_file, "w", encoding="utf-8") as f:
-        json.dump(locations, f, ensure_ascii=False, indent=2)
+    data_io.write_json(locations_file, locations)
 
     print(f"Updated settlements saved to {locations_file}")
 
@@ -1,10 +1,8 @@
 import re
-import json
-
-def main():
-    settlements_file = "data/parsed_settlements.json"
-    address_list_file = "data/source/Географічний покажчик до населених пунктів до Каталогу метричних книг.docx"
+import data_io
 
+def parse_settlements_docx(address_list_file):
+    """Parse every settlement paragraph of the geographic index document."""
     try:
         from docx import Document
     except ImportError:
@@ -26,9 +24,16 @@ def main():
             #print(f"Failed to parse settlement from line: {para.text}")
             continue
 
+    return parsed_settlements
+
+def main():
+    settlements_file = "data/parsed_settlements.json"
+    address_list_file = "data/source/Географічний покажчик до населених пунктів до Каталогу метричних книг.docx"
+
+    parsed_settlements = parse_settlements_docx(address_list_file)
+
     # Save to JSON file
-    with open(settlements_file, "w", encoding="utf-8") as json_file:
-        json.dump(parsed_settlements, json_file, ensure_ascii=False, indent=4)
+    data_io.write_json(settlements_file, parsed_settlements)
     
     print(f"Parsed {len(parsed_settlements)} settlements saved to {settlements_file}")
 
@@ -0,0 +1,93 @@
+"""
+Performance report of a pipeline run.
+
+master.py collects for every stage the wall time, CPU time, peak RSS, the number of
+records and bytes it read and wrote, and saves them as JSON (`.pipeline/run_report.json`
+by default) so runs can be compared with each other.
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import data_io
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def max_rss_kb(usage):
+    """Peak resident set size from a struct_rusage, in KiB (macOS reports bytes)."""
+    if usage is None:
+        return None
+    if sys.platform == "darwin":
+        return usage.ru_maxrss // 1024
+    return usage.ru_maxrss
+
+
+def cpu_seconds(usage):
+    if usage is None:
+        return None
+    return usage.ru_utime + usage.ru_stime
+
+
+def self_usage():
+    """Resource usage of the current process, or None where it is not available."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF)
+
+
+def count_records(data):
+    """Number of records in a loaded dataset: list items, GeoJSON features or dict keys."""
+    if isinstance(data, dict) and data.get("type") == "FeatureCollection":
+        return len(data.get("features", []))
+    if isinstance(data, (list, dict)):
+        return len(data)
+    return None
+
+
+def file_records(path):
+    """Number of records in a JSON or CSV file, None for other or missing files."""
+    if not os.path.exists(path):
+        return None
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".json", ".geojson"):
+        return count_records(data_io.read_json(path))
+    if extension == ".csv":
+        with open(path, "rb") as f:
+            return max(sum(1 for _ in f) - 1, 0)
+    return None
+
+
+def file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+class RunReport:
+    def __init__(self, mode, jobs):
+        self.started = time.perf_counter()
+        self.data = {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "mode": mode,
+            "jobs": jobs,
+            "wall_seconds": None,
+            "stages": [],
+            "saved": [],
+        }
+
+    def add_stage(self, stage, status, **fields):
+        entry = {"name": stage["name"], "script": stage["script"], "status": status}
+        entry.update(fields)
+        self.data["stages"].append(entry)
+
+    def add_saved(self, path, seconds, size):
+        self.data["saved"].append({"path": path, "seconds": round(seconds, 3), "bytes": size})
+
+    def save(self, path):
+        self.data["wall_seconds"] = round(time.perf_counter() - self.started, 3)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data_io.write_json(path, self.data, indent=2)
@@ -1,9 +1,23 @@
-import json
+import argparse
+import os
+import data_io
 import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
-# Overpass API endpoint
-url = "http://overpass-api.de/api/interpreter"
+# Overpass API endpoint; OVERPASS_URL points the geocoder (and the pipeline stage)
+# at another instance, e.g. a local one
+url = os.environ.get("OVERPASS_URL", "http://overpass-api.de/api/interpreter")
+
+# Ids per query, and queries in flight at a time (the public instance gives every
+# client a couple of slots and answers 429 to the rest)
+BATCH_SIZE = 200
+WORKERS = 2
+# Tries per query, waiting RETRY_DELAY seconds after the first failure and twice as long after every next one
+ATTEMPTS = 3
+RETRY_DELAY = 2.0
+TIMEOUT = 60
 
 
 def chunk_list(data, chunk_size):
@@ -11,82 +25,126 @@ def chunk_list(data, chunk_size):
     for i in range(0, len(data), chunk_size):
         yield data[i:i + chunk_size]
 
-def find_nodes_by_osm_ids(osm_ids):
+def find_nodes_by_osm_ids(osm_ids, session=None, api_url=None, attempts=ATTEMPTS):
     """
     Find nodes by their OSM IDs using Overpass API.
+
+    The ids are sent in one POST query, retried on connection errors, timeouts and
+    5xx / 429 answers. Returns the list of found nodes, or None if the query failed.
     """
     # Ensure the list of IDs is not empty
     if not osm_ids:
         print("No OSM IDs provided.")
         return []
-    
+
     # Build the query string; note the comma-separated list of IDs
-    query = "[out:json];\nnode(id:{});\nout skel;".format(",".join(map(str, osm_ids)))
-    
-    # Make the request to Overpass API
-    response = requests.get(url, params={'data': query})
-
-    if response.status_code == 200:
-        data = response.json()
-        return data['elements']
-    else:
+    query = "[out:json][timeout:{}];\nnode(id:{});\nout skel;".format(TIMEOUT, ",".join(map(str, osm_ids)))
+
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+        try:
+            # Make the request to Overpass API
+            response = (session or requests).post(api_url or url, data={'data': query}, timeout=TIMEOUT + 10)
+        except requests.RequestException as e:
+            print(f"Error fetching data: {e}")
+            continue
+        if response.status_code == 200:
+            try:
+                return response.json()['elements']
+            except (ValueError, KeyError) as e:
+                print(f"Error parsing the response: {e}")
+                continue
         print("Error fetching data:", response.status_code)
-        return []
+        if response.status_code != 429 and response.status_code < 500:
+            break
+    return None
 
-def update_settlements_locations(settlements):
+def update_settlements_locations(settlements, batch_size=BATCH_SIZE, workers=WORKERS, api_url=None, attempts=ATTEMPTS):
     """
-    Process a list of settlements in chunks, make an HTTP POST request for each chunk,
-    and update each settlement with the location data returned from the API.
-    
+    Look up the OSM nodes of the settlements in batches of batch_size ids, with up to
+    workers queries in flight, and update each settlement with the location of its node.
+
     Args:
-        settlements (list): List of settlement names.
-        api_url (str): URL of the API endpoint to get location data.
-    
+        settlements (list): List of settlement dictionaries with an "osm_id".
+        batch_size (int): Ids per Overpass query.
+        workers (int): Queries running at a time.
+        api_url (str): Overpass endpoint instead of the default one.
+        attempts (int): Tries per query.
+
     Returns:
-        list: List of dictionaries with updated settlement data.
+        list: All settlements in their original order. The ones whose node was not
+        found, or whose query failed, keep the location they had.
     """
-    updated_settlements = []
-    for group in chunk_list(settlements, 20):
-        # Prepare payload; adjust the key names if required by the API.
-        osm_ids = [settlement.get("osm_id") for settlement in group]
-        if not osm_ids:
-            print("No OSM IDs found in the group.")
-            continue
-        # Make the API call to get location data
-        nodes = find_nodes_by_osm_ids(osm_ids)
-        if not nodes:
-            print("No nodes found for the provided OSM IDs.")
-            continue
-        # Process the nodes to extract location data
-        for settlement in group:
-            #settlement["location"] = None
-            # Check if the settlement has a corresponding node
+    osm_ids = list(dict.fromkeys(
+        str(settlement["osm_id"]) for settlement in settlements if str(settlement.get("osm_id") or "").isdigit()
+    ))
+    batches = list(chunk_list(osm_ids, batch_size))
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max(workers, 1))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    def lookup(batch):
+        return find_nodes_by_osm_ids(batch, session, api_url, attempts)
+
+    nodes_by_id = {}
+    failed_ids = set()
+    with session, ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for batch, nodes in zip(batches, executor.map(lookup, batches)):
+            if nodes is None:
+                failed_ids.update(batch)
+                continue
             for node in nodes:
-                if node and 'id' in node and str(node['id']) == settlement.get("osm_id"):
-                    # Extract the location data from the node
-                    settlement["location"] = [node['lon'], node['lat']]
-                    break
-            
-            if not settlement.get("location"):
-                print(f"No location found for settlement with OSM ID: {settlement.get('osm_id')}")
+                if node and 'id' in node and 'lat' in node:
+                    nodes_by_id[str(node['id'])] = node
+
+    updated_settlements = []
+    not_found = 0
+    for settlement in settlements:
+        osm_id = str(settlement.get("osm_id") or "")
+        node = nodes_by_id.get(osm_id)
+        if node is not None:
+            # Extract the location data from the node
+            settlement["location"] = [node['lon'], node['lat']]
+        elif osm_id not in failed_ids:
+            not_found += 1
+            print(f"No location found for settlement with OSM ID: {settlement.get('osm_id')}")
+        updated_settlements.append(settlement)
 
-            updated_settlements.append(settlement)
+    print(f"Resolved {len(nodes_by_id)} of {len(osm_ids)} OSM nodes in {len(batches)} queries; "
+          f"{not_found} settlements without a node")
+    if failed_ids:
+        print(f"Lookup failed for {len(failed_ids)} OSM IDs; their settlements keep the previous location")
 
     return updated_settlements
 
 def main():
+    parser = argparse.ArgumentParser(description="Update settlement locations from their OSM nodes.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, metavar="N",
+                        help=f"OSM ids per Overpass query (default {BATCH_SIZE})")
+    parser.add_argument("--workers", type=int, default=WORKERS, metavar="N",
+                        help=f"Overpass queries in flight at a time (default {WORKERS})")
+    parser.add_argument("--attempts", type=int, default=ATTEMPTS, metavar="N",
+                        help=f"tries per query before giving up (default {ATTEMPTS})")
+    parser.add_argument("--url", default=url, help="Overpass API endpoint (default $OVERPASS_URL or the public instance)")
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.attempts < 1:
+        parser.error("--attempts must be at least 1")
+
     settlements_file = "data/settlements_locations.json"
     output_file = "data/settlements_locations.json"
 
     # Load settlements JSON data
-    with open(settlements_file, "r", encoding="utf-8") as f:
-        settlements = json.load(f)
+    settlements = data_io.read_json(settlements_file)
 
-    updated_settlements = update_settlements_locations(settlements)
+    updated_settlements = update_settlements_locations(settlements, args.batch_size, args.workers, args.url, args.attempts)
 
     # Save updated settlements to a new JSON file
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(updated_settlements, f, ensure_ascii=False, indent=2)
+    data_io.write_json(output_file, updated_settlements)
 
     print(f"Updated settlements with details code saved to {output_file}")
 
@@ -0,0 +1,33 @@
+"""
+Sharding of per-settlement work across worker processes.
+
+Settlements are grouped by a key (e.g. the oblast), every shard is processed by a
+worker function in a process pool together with the part of the lookup table it
+needs, and the results are put back in the original order of the settlements.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+def group_positions(keys):
+    """Map every key to the positions it occurs at, keys in order of first occurrence."""
+    shards = {}
+    for position, key in enumerate(keys):
+        shards.setdefault(key, []).append(position)
+    return shards
+
+
+def run_shards(worker, shards, jobs):
+    """
+    Call worker(*args) for every shard in a pool of jobs processes. shards maps a key to
+    (positions, args); the worker returns a list aligned with its positions. Returns the
+    results of all shards as one list in position order.
+    """
+    total = sum(len(positions) for positions, _ in shards.values())
+    results = [None] * total
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = {key: pool.submit(worker, *args) for key, (_, args) in shards.items()}
+        for key, future in futures.items():
+            for position, result in zip(shards[key][0], future.result()):
+                results[position] = result
+    return results
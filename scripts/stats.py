@@ -1,13 +1,12 @@
 import re
-import json
+import data_io
 import logging
 import csv
 
 def geojson_stats(logger):  
     geojson_path = "data/parafii.geojson"
     output_path = "data/duplicates.json"
-    with open(geojson_path, 'r', encoding='utf-8') as f:
-        geojson_data = json.load(f)
+    geojson_data = data_io.read_json(geojson_path)
 
     # Log the number of features in the geojson
     logger.info(f"Number of features in the geojson: {len(geojson_data['features'])}")
@@ -41,14 +40,12 @@ def geojson_stats(logger):
                 logger.info(f"Feature ID: {feature['properties'].get('id', 'Unknown')} - Title: {feature['properties'].get('title', 'Unknown')}")
 
     logger.info(f"Number of non-unique locations (multiple features with the same coordinates): {non_unique_count}")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(duplicates, f, ensure_ascii=False, indent=2)
+    data_io.write_json(output_path, duplicates, indent=2)
     logger.info(f"Wrote {len(duplicates)} records to {output_path}")
 
 def parafii_settlements_stats(logger):
     parafii_path = "data/parafii_locations.json"
-    with open(parafii_path, 'r', encoding='utf-8') as f:
-        parafii_data = json.load(f)
+    parafii_data = data_io.read_json(parafii_path)
 
     locations_mapping_path='data/locations_mapping.csv'
     with open(locations_mapping_path, 'r', encoding='utf-8') as f:
@@ -82,8 +79,7 @@ def parafii_settlements_stats(logger):
 
 def geobooks_stats(logger):
     settlements_path = "data/parsed_settlements.json"
-    with open(settlements_path, 'r', encoding='utf-8') as f:
-        settlements = json.load(f)
+    settlements = data_io.read_json(settlements_path)
 
     without_old_district = set()
     povit_gmina_combinations = set()
@@ -125,8 +121,7 @@ def geobooks_stats(logger):
 
 def settlements_stats(logger):
     settlements_path = "data/settlements_locations.json"
-    with open(settlements_path, 'r', encoding='utf-8') as f:
-        settlements = json.load(f)
+    settlements = data_io.read_json(settlements_path)
 
     # Log the number of settlements
     logger.info(f"Number of settlements: {len(settlements)}")
@@ -150,8 +145,7 @@ def settlements_stats(logger):
 
 def catalog_stats(logger):
     catalog_path = "data/catalog.json"
-    with open(catalog_path, 'r', encoding='utf-8') as f:
-        catalog = json.load(f)
+    catalog = data_io.read_json(catalog_path)
 
     # Log unieque territory, church_settlement, povit, volost, gmina
     unique_teritories = set()
@@ -0,0 +1,157 @@
+"""
+Tests of the decerkva crawl on the pages in scripts/__mocks__/decerkva, served in
+place of the site through the page cache interface.
+
+    python3 -m unittest discover scripts
+"""
+
+import logging
+import os
+import tempfile
+import unittest
+
+import requests
+
+import data_io
+import decerkva_parser
+import http_cache
+
+MOCK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__mocks__", "decerkva")
+EMPTY_PAGE = b"<html><body></body></html>"
+
+
+def read_mock(name):
+    with open(os.path.join(MOCK_DIR, name), "rb") as f:
+        return f.read()
+
+
+class MockSite:
+    """
+    Serves the mock pages like HttpCache.fetch does: the main page, the page of its
+    first region, the first two districts of that region and a settlement page for
+    every other page of the region. Pages of the other regions and districts are
+    empty, to keep the crawl small. URLs in failing raise a connection error, the ones
+    in missing a CacheMiss as in replay mode.
+    """
+
+    def __init__(self, failing=(), missing=()):
+        self.pages = {name: read_mock(f"{name}.html") for name in ("main", "region", "district", "settlement")}
+        main = decerkva_parser.Page(self.pages["main"].decode("windows-1251"))
+        self.region_url = decerkva_parser.region_links(main)[0][1]
+        region = decerkva_parser.Page(self.pages["region"].decode("windows-1251"))
+        links = decerkva_parser.district_links(region, self.region_url)
+        self.district_urls = {url for _, url in links[:2]}
+        self.empty_urls = {url for _, url in links[2:]}
+        self.failing = set(failing)
+        self.missing = set(missing)
+        self.fetched = []
+        self.stats = {}
+
+    def fetch(self, url, get):
+        self.fetched.append(url)
+        if url in self.failing:
+            raise requests.ConnectionError(f"{url} is unreachable")
+        if url in self.missing:
+            raise http_cache.CacheMiss(f"{url} is not in the cache")
+        if url == decerkva_parser.MAIN_URL:
+            return self.pages["main"]
+        if url == self.region_url:
+            return self.pages["region"]
+        if url in self.district_urls:
+            return self.pages["district"]
+        if url in self.empty_urls or not url.startswith(self.region_url.rsplit("/", 1)[0] + "/"):
+            return EMPTY_PAGE
+        return self.pages["settlement"]
+
+
+class CrawlJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("test_decerkva_parser")
+        self.logger.setLevel(logging.CRITICAL + 1)
+        self.retry_delay = decerkva_parser.RETRY_DELAY
+        decerkva_parser.RETRY_DELAY = 0
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.journal_file = os.path.join(self.tmp_dir.name, "journal.jsonl")
+
+    def tearDown(self):
+        decerkva_parser.RETRY_DELAY = self.retry_delay
+        self.tmp_dir.cleanup()
+
+    def crawl(self, site, workers, journal=True):
+        """The crawled records as they are saved, e.g. with locations as lists."""
+        journal = decerkva_parser.CrawlJournal(self.journal_file) if journal else None
+        records = decerkva_parser.parse_decerkva_data(self.logger, workers, rate=None, cache=site,
+                                                      journal=journal, attempts=2)
+        return data_io.loads(data_io.dumps(records))
+
+    def test_journaled_crawl_matches_crawl_without_journal(self):
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                expected = self.crawl(MockSite(), workers, journal=False)
+                self.assertTrue(expected)
+                self.assertEqual(self.crawl(MockSite(), workers), expected)
+                self.assertFalse(os.path.exists(self.journal_file))
+
+    def test_resume_retries_only_failed_pages(self):
+        site = MockSite()
+        expected = self.crawl(site, 1, journal=False)
+        district_url = sorted(site.district_urls)[0]
+        settlement_url = expected[0]["districts"][0]["settlements"][1]["url"]
+        failing = {district_url, settlement_url}
+
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                with self.assertRaises(decerkva_parser.CrawlIncomplete):
+                    self.crawl(MockSite(failing), workers)
+                self.assertTrue(os.path.exists(self.journal_file))
+
+                site = MockSite()
+                self.assertEqual(self.crawl(site, workers), expected)
+                self.assertEqual(set(site.fetched), failing)
+                self.assertFalse(os.path.exists(self.journal_file))
+
+    def test_failed_main_page_raises(self):
+        with self.assertRaises(decerkva_parser.CrawlIncomplete):
+            self.crawl(MockSite({decerkva_parser.MAIN_URL}), 1)
+        journal = decerkva_parser.CrawlJournal(self.journal_file)
+        self.assertEqual(list(journal.failed), [("main", decerkva_parser.MAIN_URL)])
+        journal.close()
+
+    def test_failed_pages_raise_without_journal(self):
+        site = MockSite()
+        district_url = sorted(site.district_urls)[0]
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                with self.assertRaises(decerkva_parser.CrawlIncomplete):
+                    self.crawl(MockSite({district_url}), workers, journal=False)
+                with self.assertRaises(decerkva_parser.CrawlIncomplete):
+                    self.crawl(MockSite({decerkva_parser.MAIN_URL}), workers, journal=False)
+
+    def test_cache_miss_is_not_retried(self):
+        district_url = sorted(MockSite().district_urls)[0]
+        site = MockSite(missing={district_url})
+        with self.assertRaises(decerkva_parser.CrawlIncomplete):
+            self.crawl(site, 1, journal=False)
+        self.assertEqual(site.fetched.count(district_url), 1)
+
+    def test_failures_of_pages_no_longer_linked_are_dropped(self):
+        journal = decerkva_parser.CrawlJournal(self.journal_file)
+        journal.fail("settlement", "http://decerkva.org.ua/gone.html", "failed after 2 attempts")
+        journal.close()
+
+        expected = self.crawl(MockSite(), 1, journal=False)
+        self.assertEqual(self.crawl(MockSite(), 1), expected)
+        self.assertFalse(os.path.exists(self.journal_file))
+
+    def test_torn_last_line_is_ignored(self):
+        expected = self.crawl(MockSite(), 1, journal=False)
+        with self.assertRaises(decerkva_parser.CrawlIncomplete):
+            self.crawl(MockSite({sorted(MockSite().district_urls)[0]}), 1)
+        with open(self.journal_file, "a", encoding="utf-8") as f:
+            f.write(data_io.dumps({"kind": "settlement", "url": "http://decerkva.org.ua/x.html"})[:20])
+
+        self.assertEqual(self.crawl(MockSite(), 1), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Tests of the Overpass node lookup against a local stand-in of the Overpass API.
+
+    python3 -m unittest discover scripts
+"""
+
+import contextlib
+import io
+import json
+import re
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import settlements_geocoder
+
+# Nodes the stand-in knows, by id: (lat, lon)
+NODES = {
+    "101": (50.1, 25.1),
+    "102": (50.2, 25.2),
+    "103": (50.3, 25.3),
+    "104": (50.4, 25.4),
+    "105": (50.5, 25.5),
+}
+
+
+class OverpassHandler(BaseHTTPRequestHandler):
+    """Answers node(id:...) queries from NODES, or with the next scripted error status."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        query = parse_qs(body)["data"][0]
+        ids = re.search(r"node\(id:([\d,]+)\)", query).group(1).split(",")
+        server = self.server
+        with server.lock:
+            server.queries.append(ids)
+            status = server.errors.pop(0) if server.errors else 200
+        if status == 200 and server.failing_id in ids:
+            status = 504
+        if status != 200:
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        elements = [{"type": "node", "id": int(i), "lat": NODES[i][0], "lon": NODES[i][1]} for i in ids if i in NODES]
+        data = json.dumps({"elements": elements}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class OverpassStandIn:
+    def __init__(self, errors=(), failing_id=None):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), OverpassHandler)
+        self.server.lock = threading.Lock()
+        self.server.queries = []
+        self.server.errors = list(errors)
+        self.server.failing_id = failing_id
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/interpreter"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def queries(self):
+        return self.server.queries
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def settlements():
+    return [
+        {"name": "Бобичі", "osm_id": "101", "location": [24.0, 49.0]},
+        {"name": "Мичілики", "osm_id": "102"},
+        {"name": "Норицьве", "osm_id": "103", "location": [24.3, 49.3]},
+        {"name": "Без вузла", "osm_id": "999", "location": [24.9, 49.9]},
+        {"name": "Ровище", "osm_id": "104"},
+        {"name": "Без ідентифікатора"},
+        {"name": "Бобичі", "osm_id": "101"},
+        {"name": "Кобува", "osm_id": "105"},
+    ]
+
+
+class UpdateSettlementsLocationsTest(unittest.TestCase):
+    def setUp(self):
+        self.retry_delay = settlements_geocoder.RETRY_DELAY
+        settlements_geocoder.RETRY_DELAY = 0
+
+    def tearDown(self):
+        settlements_geocoder.RETRY_DELAY = self.retry_delay
+
+    def update(self, overpass, batch_size, workers=1, attempts=3):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return settlements_geocoder.update_settlements_locations(
+                settlements(), batch_size, workers, overpass.url, attempts)
+
+    def test_batches(self):
+        with OverpassStandIn() as overpass:
+            updated = self.update(overpass, batch_size=2, workers=2)
+
+        self.assertEqual(sorted(overpass.queries), [["101", "102"], ["103", "999"], ["104", "105"]])
+        self.assertEqual([s["name"] for s in updated], [s["name"] for s in settlements()])
+        locations = {s["osm_id"]: s.get("location") for s in updated if "osm_id" in s}
+        self.assertEqual(locations, {
+            "101": [25.1, 50.1], "102": [25.2, 50.2], "103": [25.3, 50.3],
+            "999": [24.9, 49.9], "104": [25.4, 50.4], "105": [25.5, 50.5],
+        })
+        self.assertNotIn("location", updated[5])
+
+    def test_retries_rate_limit_and_server_errors(self):
+        with OverpassStandIn(errors=[429, 503]) as overpass:
+            updated = self.update(overpass, batch_size=10)
+
+        self.assertEqual(len(overpass.queries), 3)
+        self.assertEqual(updated[1]["location"], [25.2, 50.2])
+        self.assertEqual(updated[7]["location"], [25.5, 50.5])
+
+    def test_failed_batch_keeps_previous_locations(self):
+        with OverpassStandIn(failing_id="103") as overpass:
+            updated = self.update(overpass, batch_size=2, attempts=2)
+
+        self.assertEqual(overpass.queries.count(["103", "999"]), 2)
+        self.assertEqual(len(updated), len(settlements()))
+        self.assertEqual(updated[2]["location"], [24.3, 49.3])
+        self.assertEqual(updated[3]["location"], [24.9, 49.9])
+        self.assertEqual(updated[0]["location"], [25.1, 50.1])
+        self.assertEqual(updated[4]["location"], [25.4, 50.4])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,5 @@
 import re
-import json
+import data_io
 import logging
 import csv
 import requests
@@ -59,8 +59,7 @@ def find_settlement_churches(node_id, logger,retry=2):
 
 def parafii_settlements(logger):
     parafii_path = "data/parafii_locations.json"
-    with open(parafii_path, 'r', encoding='utf-8') as f:
-        parafii_data = json.load(f)
+    parafii_data = data_io.read_json(parafii_path)
 
     locations_mapping_path='data/locations_mapping.csv'
     with open(locations_mapping_path, 'r', encoding='utf-8') as f:
@@ -124,8 +123,7 @@ def main():
         #     logger.info(f"  Church: {name}, Type: {church_type}, Location: ({lat}, {lon})")
 
     output_path = "data/temp_settlement_churches.json"
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    data_io.write_json(output_path, output, indent=2)
     logger.info(f"Wrote {len(output)} records to {output_path}")
 
 